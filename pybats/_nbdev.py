@@ -7,18 +7,34 @@ index = {"dglm": "00_dglm.ipynb",
          "pois_dglm": "00_dglm.ipynb",
          "dlm": "00_dglm.ipynb",
          "bin_dglm": "00_dglm.ipynb",
+         "model_config": "00_dglm.ipynb",
+         "snapshot_version": "00_dglm.ipynb",
+         "save_models": "00_dglm.ipynb",
+         "load_models": "00_dglm.ipynb",
          "update_F": "01_update.ipynb",
+         "clear_forecast_cache": "01_update.ipynb",
+         "G_block_plan": "01_update.ipynb",
+         "apply_G": "01_update.ipynb",
+         "work_buffers": "01_update.ipynb",
+         "posterior_cov": "01_update.ipynb",
+         "evolve": "01_update.ipynb",
          "update": "01_update.ipynb",
          "update_dlm": "01_update.ipynb",
          "update_bindglm": "01_update.ipynb",
+         "G_power": "02_forecast.ipynb",
+         "state_cache": "02_forecast.ipynb",
          "forecast_aR": "02_forecast.ipynb",
          "forecast_R_cov": "02_forecast.ipynb",
+         "forecast_path_cov": "02_forecast.ipynb",
+         "forecast_horizons_mean_and_var": "02_forecast.ipynb",
+         "forecast_conjugate_params": "02_forecast.ipynb",
          "forecast_marginal": "02_forecast.ipynb",
          "forecast_marginal_bindglm": "02_forecast.ipynb",
          "forecast_state_mean_and_var": "02_forecast.ipynb",
          "forecast_path": "02_forecast.ipynb",
          "forecast_path_copula": "02_forecast.ipynb",
          "forecast_path_dlm": "02_forecast.ipynb",
+         "copula_uniform_samples": "02_forecast.ipynb",
          "forecast_path_copula_sim": "02_forecast.ipynb",
          "forecast_path_copula_density_MC": "02_forecast.ipynb",
          "forecast_joint_copula_sim": "02_forecast.ipynb",
@@ -44,17 +60,30 @@ index = {"dglm": "00_dglm.ipynb",
          "sample_seasonal_effect_fxnl": "04_seasonal.ipynb",
          "forecast_weekly_seasonal_factor": "04_seasonal.ipynb",
          "forecast_path_weekly_seasonal_factor": "04_seasonal.ipynb",
+         "init_forecast_samples": "05_analysis.ipynb",
+         "forecast_rows": "05_analysis.ipynb",
          "analysis": "05_analysis.ipynb",
+         "analysis_stream": "05_analysis.ipynb",
          "analysis_dcmm": "05_analysis.ipynb",
          "analysis_dbcm": "05_analysis.ipynb",
          "analysis_dlmm": "05_analysis.ipynb",
+         "run_one": "05_analysis.ipynb",
+         "reseed_worker": "05_analysis.ipynb",
+         "run_many": "05_analysis.ipynb",
+         "request_key": "05_analysis.ipynb",
+         "horizon_rows": "05_analysis.ipynb",
+         "horizon_row": "05_analysis.ipynb",
+         "online_forecaster": "05_analysis.ipynb",
          "beta_approx": "06_conjugates.ipynb",
          "gamma_approx": "06_conjugates.ipynb",
          "gamma_alpha_approx": "06_conjugates.ipynb",
          "pois_alpha_param": "06_conjugates.ipynb",
+         "gamma_newton": "06_conjugates.ipynb",
+         "beta_newton": "06_conjugates.ipynb",
          "gamma_solver": "06_conjugates.ipynb",
          "beta_solver": "06_conjugates.ipynb",
          "conj_params": "06_conjugates.ipynb",
+         "get_interpolator": "06_conjugates.ipynb",
          "bern_conjugate_params": "06_conjugates.ipynb",
          "pois_conjugate_params": "06_conjugates.ipynb",
          "bin_conjugate_params": "06_conjugates.ipynb",
@@ -79,9 +108,15 @@ index = {"dglm": "00_dglm.ipynb",
          "plot_coef": "09_plot.ipynb",
          "plot_corr": "09_plot.ipynb",
          "load_interpolators": "10_shared.ipynb",
+         "interp_linear_2d": "10_shared.ipynb",
+         "table_transformer": "10_shared.ipynb",
+         "gamma_table_transformer": "10_shared.ipynb",
          "transformer": "10_shared.ipynb",
          "gamma_transformer": "10_shared.ipynb",
+         "digamma_trigamma_scalar": "10_shared.ipynb",
+         "digamma_trigamma": "10_shared.ipynb",
          "trigamma": "10_shared.ipynb",
+         "asymptotic_coefs": "10_shared.ipynb",
          "save": "10_shared.ipynb",
          "load": "10_shared.ipynb",
          "define_holiday_regressors": "10_shared.ipynb",
@@ -96,6 +131,9 @@ index = {"dglm": "00_dglm.ipynb",
          "load_us_inflation_forecasts": "10_shared.ipynb",
          "dcmm": "11_dcmm.ipynb",
          "dbcm": "12_dbcm.ipynb",
+         "store_row": "13_latent_factor.ipynb",
+         "read_only": "13_latent_factor.ipynb",
+         "pad_forecast_cov": "13_latent_factor.ipynb",
          "latent_factor": "13_latent_factor.ipynb",
          "multi_latent_factor": "13_latent_factor.ipynb",
          "Y_fxn": "13_latent_factor.ipynb",
@@ -136,7 +174,11 @@ index = {"dglm": "00_dglm.ipynb",
          "get_mean_and_var_lf_dlm": "14_latent_factor_fxns.ipynb",
          "forecast_marginal_lf_analytic": "14_latent_factor_fxns.ipynb",
          "forecast_path_lf_copula": "14_latent_factor_fxns.ipynb",
+         "get_lf_pool": "14_latent_factor_fxns.ipynb",
+         "lf_pools": "14_latent_factor_fxns.ipynb",
+         "shutdown_lf_pools": "14_latent_factor_fxns.ipynb",
          "update_lf_sample": "14_latent_factor_fxns.ipynb",
+         "update_lf_sample_batch": "14_latent_factor_fxns.ipynb",
          "update_lf_sample_forwardfilt": "14_latent_factor_fxns.ipynb",
          "forecast_marginal_lf_sample": "14_latent_factor_fxns.ipynb",
          "lf_simulate_from_sample": "14_latent_factor_fxns.ipynb",
@@ -145,7 +187,11 @@ index = {"dglm": "00_dglm.ipynb",
          "forecast_joint_marginal_lf_copula_dcmm": "14_latent_factor_fxns.ipynb",
          "forecast_marginal_lf_dcmm": "14_latent_factor_fxns.ipynb",
          "forecast_path_lf_dcmm": "14_latent_factor_fxns.ipynb",
-         "dlmm": "15_dlmm.ipynb"}
+         "dlmm": "15_dlmm.ipynb",
+         "dglm_batch": "16_batch.ipynb",
+         "update_batch": "16_batch.ipynb",
+         "update_dlm_batch": "16_batch.ipynb",
+         "update_bindglm_batch": "16_batch.ipynb"}
 
 modules = ["dglm.py",
            "update.py",
@@ -162,7 +208,8 @@ modules = ["dglm.py",
            "dbcm.py",
            "latent_factor.py",
            "latent_factor_fxns.py",
-           "dlmm.py"]
+           "dlmm.py",
+           "batch.py"]
 
 doc_url = "https://lavinei.github.io/pybats/"
 
@@ -1,6 +1,7 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/05_analysis.ipynb (unless otherwise specified).
 
-__all__ = ['analysis', 'analysis_dcmm', 'analysis_dbcm', 'analysis_dlmm']
+__all__ = ['analysis', 'analysis_stream', 'analysis_dcmm', 'analysis_dbcm', 'analysis_dlmm', 'run_many',
+           'online_forecaster']
 
 # Internal Cell
 #exporti
@@ -9,7 +10,49 @@ import pandas as pd
 
 from .define_models import define_dglm, define_dcmm, define_dbcm, define_dlmm
 from .shared import define_holiday_regressors
+from .dbcm import dbcm
 from collections.abc import Iterable
+import multiprocessing
+import os
+
+# Internal Cell
+def init_forecast_samples(nsamps, ndates, k, forecast_out=None):
+    """
+    Allocate the nsamps x ndates x k array of forecast samples. If forecast_out is a file path or an np.memmap, the
+    samples are written to disk instead. On disk they are stored date-major, with shape (ndates, nsamps, k), so the
+    samples for each forecast date are contiguous, and the returned array is a nsamps x ndates x k view of the file.
+    An np.memmap that is passed in must have that shape, be writable, and have a dtype that holds float64 values.
+    """
+    if forecast_out is None:
+        return np.zeros([nsamps, ndates, k])
+
+    if isinstance(forecast_out, np.memmap):
+        if forecast_out.shape != (ndates, nsamps, k):
+            raise ValueError('Error: forecast_out must have shape (number of forecast dates, nsamps, k) = ' +
+                             str((ndates, nsamps, k)) + ', not ' + str(forecast_out.shape))
+        if not np.can_cast(np.float64, forecast_out.dtype, casting='safe'):
+            raise ValueError('Error: forecast_out must have a dtype that holds float64 values, not ' +
+                             str(forecast_out.dtype))
+        if not forecast_out.flags.writeable:
+            raise ValueError('Error: forecast_out must be opened for writing')
+        store = forecast_out
+    else:
+        store = np.lib.format.open_memmap(forecast_out, mode='w+', dtype=np.float64, shape=(ndates, nsamps, k))
+
+    return store.transpose(1, 0, 2)
+
+# Internal Cell
+def forecast_rows(dates, forecast_start, forecast_end):
+    """
+    Convert forecast_start and forecast_end into row numbers, if they are given as dates.
+    """
+    if dates is not None:
+        dates = pd.Series(dates)
+        if type(forecast_start) == type(dates.iloc[0]):
+            forecast_start = np.where(dates == forecast_start)[0][0]
+        if type(forecast_end) == type(dates.iloc[0]):
+            forecast_end = np.where(dates == forecast_end)[0][0]
+    return forecast_start, forecast_end
 
 # Cell
 def analysis(Y, X=None, k=1, forecast_start=0, forecast_end=0,
@@ -19,7 +62,7 @@ def analysis(Y, X=None, k=1, forecast_start=0, forecast_end=0,
              seasPeriods = [], seasHarmComponents = [],
              latent_factor = None, new_latent_factors = None,
              ret=['model', 'forecast'],
-             mean_only = False, forecast_path = False,
+             mean_only = False, forecast_path = False, forecast_out = None,
              **kwargs):
     """
     This is a helpful function to run a standard analysis. The function will:
@@ -28,6 +71,61 @@ def analysis(Y, X=None, k=1, forecast_start=0, forecast_end=0,
     3. Forecast at each specified time step
     """
 
+    stream = analysis_stream(Y, X=X, k=k, forecast_start=forecast_start, forecast_end=forecast_end,
+                             nsamps=nsamps, family=family, n=n,
+                             model_prior=model_prior, prior_length=prior_length, ntrend=ntrend,
+                             dates=dates, holidays=holidays,
+                             seasPeriods=seasPeriods, seasHarmComponents=seasHarmComponents,
+                             latent_factor=latent_factor, new_latent_factors=new_latent_factors,
+                             ret=ret, mean_only=mean_only, forecast_path=forecast_path,
+                             **kwargs)
+
+    # Convert dates into row numbers, in the same way as analysis_stream
+    forecast_start, forecast_end = forecast_rows(dates, forecast_start, forecast_end)
+
+    if mean_only:
+        forecast = init_forecast_samples(1, forecast_end - forecast_start + 1, k, forecast_out)
+    else:
+        forecast = init_forecast_samples(nsamps, forecast_end - forecast_start + 1, k, forecast_out)
+
+    # Run the analysis, storing the forecast samples as they are produced
+    while True:
+        try:
+            t, date, samples = next(stream)
+        except StopIteration as finished:
+            results = finished.value
+            break
+        forecast[:, t - forecast_start, :] = samples
+
+    if isinstance(forecast, np.memmap):
+        forecast.flush()
+
+    out = []
+    for obj in ret:
+        if obj == 'forecast': out.append(forecast)
+        if obj in results: out.append(results[obj])
+
+    if len(out) == 1:
+        return out[0]
+    else:
+        return out
+
+# Cell
+def analysis_stream(Y, X=None, k=1, forecast_start=0, forecast_end=0,
+                    nsamps=500, family = 'normal', n = None,
+                    model_prior = None, prior_length=20, ntrend=1,
+                    dates = None, holidays = [],
+                    seasPeriods = [], seasHarmComponents = [],
+                    latent_factor = None, new_latent_factors = None,
+                    ret=['model', 'forecast'],
+                    mean_only = False, forecast_path = False,
+                    **kwargs):
+    """
+    Generator version of `analysis`. Instead of storing every forecast, it yields a tuple (t, date, samples) as soon as
+    the forecast at time t is made, where samples is the nsamps x k array of forecast samples (1 x k if mean_only=True).
+    When the generator is exhausted, its return value is a dictionary with the other outputs requested in ret.
+    """
+
     # Add the holiday indicator variables to the regression matrix
     nhol = len(holidays)
     X = define_holiday_regressors(X, dates, holidays)
@@ -47,14 +145,10 @@ def analysis(Y, X=None, k=1, forecast_start=0, forecast_end=0,
     else:
         mod = model_prior
 
-
     # Convert dates into row numbers
+    forecast_start, forecast_end = forecast_rows(dates, forecast_start, forecast_end)
     if dates is not None:
         dates = pd.Series(dates)
-        if type(forecast_start) == type(dates.iloc[0]):
-            forecast_start = np.where(dates == forecast_start)[0][0]
-        if type(forecast_end) == type(dates.iloc[0]):
-            forecast_end = np.where(dates == forecast_end)[0][0]
 
     # Define the run length
     T = len(Y) + 1
@@ -88,11 +182,6 @@ def analysis(Y, X=None, k=1, forecast_start=0, forecast_end=0,
     # Initialize updating + forecasting
     horizons = np.arange(1, k + 1)
 
-    if mean_only:
-        forecast = np.zeros([1, forecast_end - forecast_start + 1, k])
-    else:
-        forecast = np.zeros([nsamps, forecast_end - forecast_start + 1, k])
-
     for t in range(prior_length, T):
 
         if forecast_start <= t <= forecast_end:
@@ -103,32 +192,30 @@ def analysis(Y, X=None, k=1, forecast_start=0, forecast_end=0,
                 if is_lf:
                     if forecast_path:
                         pm, ps, pp = latent_factor.get_lf_forecast(dates.iloc[t])
-                        forecast[:, t - forecast_start, :] = mod.forecast_path_lf_copula(k=k, X=X[t + horizons - 1, :],
-                                                                                         nsamps=nsamps,
-                                                                                         phi_mu=pm, phi_sigma=ps, phi_psi=pp)
+                        samples = mod.forecast_path_lf_copula(k=k, X=X[t + horizons - 1, :],
+                                                              nsamps=nsamps,
+                                                              phi_mu=pm, phi_sigma=ps, phi_psi=pp)
                     else:
                         pm, ps = latent_factor.get_lf_forecast(dates.iloc[t])
                         pp = None  # Not including path dependency in latent factor
 
-                        forecast[:, t - forecast_start, :] = np.array(list(map(
+                        samples = np.array(list(map(
                             lambda k, x, pm, ps:
                             mod.forecast_marginal_lf_analytic(k=k, X=x, phi_mu=pm, phi_sigma=ps, nsamps=nsamps, mean_only=mean_only),
                             horizons, X[t + horizons - 1, :], pm, ps))).squeeze().T.reshape(-1, k)#.reshape(-1, 1)
                 else:
                     if forecast_path:
-                        forecast[:, t - forecast_start, :] = mod.forecast_path(k=k, X = X[t + horizons - 1, :], nsamps=nsamps)
+                        samples = mod.forecast_path(k=k, X = X[t + horizons - 1, :], nsamps=nsamps)
                     else:
+                        # Get the forecast samples for all the items over the 1:k step ahead marginal forecast distributions
                         if family == "binomial":
-                            forecast[:, t - forecast_start, :] = np.array(list(map(
-                                lambda k, n, x:
-                                mod.forecast_marginal(k=k, n=n, X=x, nsamps=nsamps, mean_only=mean_only),
-                                horizons, n[t + horizons - 1], X[t + horizons - 1, :]))).squeeze().T.reshape(-1, k)  # .reshape(-1, 1)
+                            samples = mod.forecast_marginal(k=horizons, n=n[t + horizons - 1], X=X[t + horizons - 1, :],
+                                                            nsamps=nsamps, mean_only=mean_only)
                         else:
-                            # Get the forecast samples for all the items over the 1:k step ahead marginal forecast distributions
-                            forecast[:, t - forecast_start, :] = np.array(list(map(
-                                lambda k, x:
-                                mod.forecast_marginal(k=k, X=x, nsamps=nsamps, mean_only=mean_only),
-                                horizons, X[t + horizons - 1, :]))).squeeze().T.reshape(-1, k)#.reshape(-1, 1)
+                            samples = mod.forecast_marginal(k=horizons, X=X[t + horizons - 1, :],
+                                                            nsamps=nsamps, mean_only=mean_only)
+
+                yield t, None if dates is None else dates.iloc[t], samples
 
             if ret.__contains__('new_latent_factors'):
                 for lf in new_latent_factors:
@@ -158,29 +245,25 @@ def analysis(Y, X=None, k=1, forecast_start=0, forecast_end=0,
                 for lf in new_latent_factors:
                     lf.generate_lf(date=dates[t], mod=mod, Y=Y[t], X=X[t], k=k, nsamps=nsamps)
 
-    out = []
+    results = {}
     for obj in ret:
-        if obj == 'forecast': out.append(forecast)
-        if obj == 'model': out.append(mod)
+        if obj == 'model': results['model'] = mod
         if obj == 'model_coef':
             mod_coef = {'m':m, 'C':C}
             if family == 'normal':
                 mod_coef.update({'n':n, 's':s})
 
-            out.append(mod_coef)
+            results['model_coef'] = mod_coef
         if obj == 'new_latent_factors':
             #for lf in new_latent_factors:
             #    lf.append_lf()
             #    lf.append_lf_forecast()
             if len(new_latent_factors) == 1:
-                out.append(new_latent_factors[0])
+                results['new_latent_factors'] = new_latent_factors[0]
             else:
-                out.append(new_latent_factors)
+                results['new_latent_factors'] = new_latent_factors
 
-    if len(out) == 1:
-        return out[0]
-    else:
-        return out
+    return results
 
 # Cell
 def analysis_dcmm(Y, X=None, k=1, forecast_start=0, forecast_end=0,
@@ -189,7 +272,7 @@ def analysis_dcmm(Y, X=None, k=1, forecast_start=0, forecast_end=0,
                   dates=None, holidays=[],
                   seasPeriods=[], seasHarmComponents=[],
                   latent_factor=None, new_latent_factors=None,
-                  mean_only=False,
+                  mean_only=False, forecast_out=None,
                   ret=['model', 'forecast'],
                    **kwargs):
     """
@@ -250,9 +333,9 @@ def analysis_dcmm(Y, X=None, k=1, forecast_start=0, forecast_end=0,
     horizons = np.arange(1,k+1)
 
     if mean_only:
-        forecast = np.zeros([1, forecast_end - forecast_start + 1, k])
+        forecast = init_forecast_samples(1, forecast_end - forecast_start + 1, k, forecast_out)
     else:
-        forecast = np.zeros([nsamps, forecast_end - forecast_start + 1, k])
+        forecast = init_forecast_samples(nsamps, forecast_end - forecast_start + 1, k, forecast_out)
 
     # Run updating + forecasting
     for t in range(prior_length, T):
@@ -321,6 +404,9 @@ def analysis_dcmm(Y, X=None, k=1, forecast_start=0, forecast_end=0,
                     lf.generate_lf(date=dates.iloc[t], mod=mod, X=X[t + horizons - 1, :],
                                        k=k, nsamps=nsamps, horizons=horizons)
 
+    if isinstance(forecast, np.memmap):
+        forecast.flush()
+
     out = []
     for obj in ret:
         if obj == 'forecast': out.append(forecast)
@@ -346,7 +432,7 @@ def analysis_dbcm(Y_transaction, X_transaction, Y_cascade, X_cascade, excess,
                   dates=None, holidays = [],
                   latent_factor = None, new_latent_factors = None,
                   seasPeriods = [], seasHarmComponents = [],
-                  mean_only=False,
+                  mean_only=False, forecast_out=None,
                   ret=['model', 'forecast'],
                    **kwargs):
     """
@@ -400,9 +486,9 @@ def analysis_dbcm(Y_transaction, X_transaction, Y_cascade, X_cascade, excess,
     horizons = np.arange(1,k+1)
 
     if mean_only:
-        forecast = np.zeros([1, forecast_end - forecast_start + 1, k])
+        forecast = init_forecast_samples(1, forecast_end - forecast_start + 1, k, forecast_out)
     else:
-        forecast = np.zeros([nsamps, forecast_end - forecast_start + 1, k])
+        forecast = init_forecast_samples(nsamps, forecast_end - forecast_start + 1, k, forecast_out)
 
     T = len(Y_transaction) + 1 #np.min([len(Y_transaction)- k, forecast_end]) + 1
     nu = 9
@@ -484,6 +570,9 @@ def analysis_dbcm(Y_transaction, X_transaction, Y_cascade, X_cascade, excess,
                                        X_cascade = X_cascade[t + horizons - 1, :],
                                        k=k, nsamps=nsamps, horizons=horizons)
 
+    if isinstance(forecast, np.memmap):
+        forecast.flush()
+
     out = []
     for obj in ret:
         if obj == 'forecast': out.append(forecast)
@@ -509,7 +598,7 @@ def analysis_dlmm(Y, X, k=1, forecast_start=0, forecast_end=0,
                   dates=None, holidays=[],
                   seasPeriods=[], seasHarmComponents=[],
                   latent_factor=None, new_latent_factors=None,
-                  mean_only=False,
+                  mean_only=False, forecast_out=None,
                   ret=['model', 'forecast'],
                    **kwargs):
     """
@@ -569,9 +658,9 @@ def analysis_dlmm(Y, X, k=1, forecast_start=0, forecast_end=0,
     horizons = np.arange(1,k+1)
 
     if mean_only:
-        forecast = np.zeros([1, forecast_end - forecast_start + 1, k])
+        forecast = init_forecast_samples(1, forecast_end - forecast_start + 1, k, forecast_out)
     else:
-        forecast = np.zeros([nsamps, forecast_end - forecast_start + 1, k])
+        forecast = init_forecast_samples(nsamps, forecast_end - forecast_start + 1, k, forecast_out)
 
     T = len(Y) + 1
     nu = 9
@@ -654,6 +743,9 @@ def analysis_dlmm(Y, X, k=1, forecast_start=0, forecast_end=0,
             n[t] = mod.dlm.n / mod.dlm.delVar
             s[t] = mod.dlm.s
 
+    if isinstance(forecast, np.memmap):
+        forecast.flush()
+
     out = []
     for obj in ret:
         if obj == 'forecast': out.append(forecast)
@@ -673,4 +765,160 @@ def analysis_dlmm(Y, X, k=1, forecast_start=0, forecast_end=0,
     if len(out) == 1:
         return out[0]
     else:
-        return out
\ No newline at end of file
+        return out
+
+# Internal Cell
+def run_one(task):
+    """
+    Run a single analysis inside a worker. Any exception is returned instead of raised, so one failing series does not
+    abort the other series. The forecasts draw from the global numpy random state, so when a seed is given the state is
+    restored afterwards, leaving the random state of the caller unchanged when the series are run in this process.
+    """
+    i, analysis_fn, spec, seed = task
+    if seed is not None:
+        state = np.random.get_state()
+        np.random.seed(seed + i)
+    try:
+        if isinstance(spec, dict):
+            return analysis_fn(**spec)
+        Y, X, dates, kwargs = spec
+        return analysis_fn(Y, X, dates=dates, **kwargs)
+    except Exception as e:
+        return e
+    finally:
+        if seed is not None:
+            np.random.set_state(state)
+
+# Internal Cell
+def reseed_worker():
+    # Forked workers inherit the same random state, so each one is reseeded when it starts
+    np.random.seed()
+
+# Cell
+def run_many(specs, analysis_fn=analysis, processes=None, chunksize=None, seed=None):
+    """
+    Run an analysis independently for many series, using a pool of worker processes.
+
+    :param specs: List of series. Each one is either a tuple (Y, X, dates, kwargs), or a dictionary of keyword arguments for analysis_fn
+    :param analysis_fn: Analysis function to run on each series, e.g. analysis or analysis_dcmm. It must be importable by the workers
+    :param processes: Number of worker processes. Defaults to the number of CPUs. With processes=1 the series are run in this process
+    :param chunksize: Number of series sent to a worker at a time
+    :param seed: If given, series i is run with the random seed seed + i, so results do not depend on the process it ran in
+    :return: List with the output of analysis_fn for each series, in the same order as specs. If a series fails, its entry is the exception that was raised
+    """
+    tasks = [(i, analysis_fn, spec, seed) for i, spec in enumerate(specs)]
+
+    if processes == 1:
+        return list(map(run_one, tasks))
+
+    if processes is None:
+        processes = os.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (4 * processes))
+
+    # The workers are reused for every chunk, so the package is only imported once per process
+    with multiprocessing.Pool(processes, initializer=reseed_worker) as pool:
+        return list(pool.imap(run_one, tasks, chunksize))
+
+# Internal Cell
+def request_key(value):
+    # Hashable key for the arguments of a forecast request
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return request_key(value.tolist())
+        return value.shape, value.dtype.str, value.tobytes()
+    if isinstance(value, (list, tuple)):
+        return tuple(request_key(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((name, request_key(v)) for name, v in value.items()))
+    return value
+
+# Internal Cell
+def horizon_rows(X, k):
+    # Covariates with one row per horizon. A tuple holds separate covariates for each model in a DCMM
+    if X is None:
+        return None
+    if isinstance(X, tuple):
+        return tuple(horizon_rows(x, k) for x in X)
+    return np.asarray(X).reshape(k, -1)
+
+
+def horizon_row(X, h):
+    # Covariates at horizon h, from the output of horizon_rows
+    if X is None:
+        return None
+    if isinstance(X, tuple):
+        return tuple(horizon_row(x, h) for x in X)
+    return X[h - 1]
+
+# Cell
+class online_forecaster:
+    def __init__(self, mod, k=1, nsamps=500):
+        """
+        Incremental forecasting with a live model, when new observations arrive one at a time.
+
+        :param mod: A DGLM, DCMM or DBCM, e.g. the 'model' output of `analysis`
+        :param k: Default forecast horizon
+        :param nsamps: Default number of forecast samples
+        :return An object of class online_forecaster
+        """
+        self.mod = mod
+        self.k = k
+        self.nsamps = nsamps
+        self.forecasts = {}
+
+        # The inputs to a DBCM are named for the transaction model
+        self.is_dbcm = isinstance(mod, dbcm)
+
+    def observe(self, y=None, X=None, **kwargs):
+        """
+        Update the model after observing 'y', with covariates 'X'. Other arguments are passed on to the model's update,
+        such as 'n' for a binomial DGLM, or 'y_cascade' and 'X_cascade' for a DBCM.
+        """
+        if self.is_dbcm:
+            self.mod.update(y_transaction=y, X_transaction=X, **kwargs)
+        else:
+            self.mod.update(y=y, X=X, **kwargs)
+
+        # The cached forecasts are from the previous state
+        self.forecasts.clear()
+
+    def forecast(self, k=None, X=None, nsamps=None, mean_only=False, path=False, **kwargs):
+        """
+        Forecast over the next 1:k steps. Repeated requests with the same arguments are served from a cache, until the
+        next observation arrives.
+
+        :param k: Forecast horizon
+        :param X: Covariates over the next k steps, with one row per horizon. For a DCMM (or the transactions in a
+        DBCM), this can be a tuple with separate covariates for the Bernoulli and Poisson models
+        :param nsamps: Number of forecast samples
+        :param mean_only: Return the forecast means, instead of samples (marginal forecasts only)
+        :param path: Simulate from the path (joint) forecast distribution, instead of the marginal forecast distributions
+        :param kwargs: Other inputs to the model's forecast function, such as 'n' for a binomial DGLM or 'X_cascade' for
+        a DBCM. For marginal forecasts, these also have one row per horizon
+        :return: Array of forecast samples, nsamps x k (1 x k if mean_only=True)
+        """
+        k = self.k if k is None else k
+        nsamps = self.nsamps if nsamps is None else nsamps
+        if path and mean_only:
+            raise ValueError('Error: mean_only is only available for marginal forecasts')
+
+        key = request_key((k, X, nsamps, mean_only, path, kwargs))
+        if key not in self.forecasts:
+            X = horizon_rows(X, k)
+
+            if path:
+                xname = 'X_transaction' if self.is_dbcm else 'X'
+                samples = self.mod.forecast_path(k=k, nsamps=nsamps, **{xname: X}, **kwargs)
+            elif self.is_dbcm:
+                # The cascade in a DBCM is forecast one horizon at a time
+                samples = np.column_stack([np.ravel(self.mod.forecast_marginal(
+                    k=h, nsamps=nsamps, mean_only=mean_only, X_transaction=horizon_row(X, h),
+                    **{name: v[h - 1] for name, v in kwargs.items()})) for h in range(1, k + 1)])
+            else:
+                # All of the horizons are forecast in one call
+                samples = self.mod.forecast_marginal(k=np.arange(1, k + 1), X=X, nsamps=nsamps, mean_only=mean_only,
+                                                     **kwargs)
+            self.forecasts[key] = samples
+
+        return self.forecasts[key].copy()
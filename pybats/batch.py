@@ -0,0 +1,253 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/16_batch.ipynb (unless otherwise specified).
+
+__all__ = ['dglm_batch', 'update_batch', 'update_dlm_batch', 'update_bindglm_batch']
+
+# Internal Cell
+#exporti
+import numpy as np
+from .dglm import dlm, bin_dglm
+from .update import clear_forecast_cache
+
+# Cell
+class dglm_batch:
+    def __init__(self, mod_list):
+        """
+        A batch of DGLMs of the same family and state vector structure, which are updated together.
+
+        :param mod_list: List of N DGLMs of the same class, with identical components
+        :return An object of class dglm_batch
+        """
+
+        mod = mod_list[0]
+        if not all(type(m) == type(mod) for m in mod_list):
+            raise ValueError('Error: All models in a batch must be of the same class')
+        if not all(m.F.shape == mod.F.shape for m in mod_list):
+            raise ValueError('Error: All models in a batch must have the same state vector length')
+        if mod.latent_factor:
+            raise ValueError('Error: Latent factor DGLMs are not supported in a batch')
+
+        # The first model is used for the family-specific conjugate updates
+        self.mod = mod
+        self.mod_list = mod_list
+        self.N = len(mod_list)
+        self.p = mod.F.shape[0]
+        self.is_dlm = isinstance(mod, dlm)
+        self.is_bin = isinstance(mod, bin_dglm)
+
+        self.iregn = mod.iregn
+        self.nregn = mod.nregn
+        self.adapt_discount = mod.adapt_discount
+        self.k = mod.k
+
+        # Stack up the state vectors
+        self.a = np.stack([m.a.reshape(-1) for m in mod_list]).astype(float)
+        self.R = np.stack([m.R for m in mod_list]).astype(float)
+        self.F = np.stack([m.F.reshape(-1) for m in mod_list]).astype(float)
+        self.G = np.stack([m.G for m in mod_list]).astype(float)
+        self.W = np.stack([m.W for m in mod_list]).astype(float)
+        self.Discount = np.stack([m.Discount for m in mod_list]).astype(float)
+        self.rho = np.array([m.rho for m in mod_list], dtype=float)
+
+        self.param1 = np.array([np.ravel(m.param1)[0] for m in mod_list], dtype=float)
+        self.param2 = np.array([np.ravel(m.param2)[0] for m in mod_list], dtype=float)
+
+        if self.is_dlm:
+            self.n = np.array([np.ravel(m.n)[0] for m in mod_list], dtype=float)
+            self.s = np.array([np.ravel(m.s)[0] for m in mod_list], dtype=float)
+            self.delVar = np.array([m.delVar for m in mod_list], dtype=float)
+
+        self.t = mod.t
+
+    def update(self, y=None, X=None, n=None):
+        """
+        Update all N DGLMs after observing 'y', a vector of length N, with covariates 'X', an (N, nregn) matrix.
+
+        Missing values in 'y' (np.nan) leave the corresponding model's posterior equal to its prior.
+        """
+        if self.is_dlm:
+            update_dlm_batch(self, y, X)
+        elif self.is_bin:
+            update_bindglm_batch(self, n, y, X)
+        else:
+            update_batch(self, y, X)
+
+    def update_F(self, X):
+        if self.nregn > 0 and X is not None:
+            self.F[:, self.iregn] = np.asarray(X, dtype=float).reshape(self.N, self.nregn)
+
+    def get_mean_and_var(self, F, a, R):
+        ft = np.einsum('ij,ij->i', F, a)
+        RF = np.einsum('ijk,ik->ij', R, F)
+        qt = np.einsum('ij,ij->i', F, RF)
+        if self.is_dlm:
+            qt = qt + self.s
+        else:
+            qt = qt / self.rho
+        return ft, qt, RF
+
+    def get_conjugate_params(self, ft, qt, alpha_init, beta_init):
+        # the conjugate maps solve arrays of (ft, qt) in one call
+        alpha, beta = self.mod.get_conjugate_params(ft, qt, alpha_init, beta_init)
+        return np.reshape(alpha, ft.shape), np.reshape(beta, ft.shape)
+
+    def get_W(self, X=None):
+        if self.adapt_discount == 'info':
+            Rdiag = np.diagonal(self.R, axis1=1, axis2=2)
+            info = np.abs(self.a / np.sqrt(Rdiag))
+            diag = np.diagonal(self.Discount, axis1=1, axis2=2)
+            diag = np.round(diag + (1 - diag) * np.exp(-self.k * info), 5)
+            W = np.zeros(self.R.shape)
+            idx = np.arange(self.p)
+            W[:, idx, idx] = Rdiag / diag - Rdiag
+            return W
+        elif self.adapt_discount == 'positive_regn' and X is not None and self.nregn > 0:
+            # Don't discount the regression coefficients whose predictor is 0
+            zero = np.zeros([self.N, self.p], dtype=bool)
+            zero[:, self.iregn] = np.asarray(X, dtype=float).reshape(self.N, self.nregn) == 0
+            Discount = np.where(zero[:, :, None] | zero[:, None, :], 1., self.Discount)
+        else:
+            Discount = self.Discount
+        return self.R / Discount - self.R
+
+    def evolve(self, obs, X=None):
+        # Get priors a, R for time t + 1 from the posteriors m, C
+        self.a = np.einsum('ijk,ik->ij', self.G, self.m)
+        self.R = self.G @ self.C @ self.G.transpose(0, 2, 1)
+        self.R = (self.R + self.R.transpose(0, 2, 1)) / 2
+
+        # Discount information in the time t + 1 prior, only where y was observed
+        self.W = self.get_W(X=X)
+        self.R[obs] = self.R[obs] + self.W[obs]
+
+    def get_models(self):
+        """
+        Copy the current state of the batch back into the individual DGLMs, and return them as a list.
+        """
+        for i, mod in enumerate(self.mod_list):
+            clear_forecast_cache(mod)
+            mod.a = self.a[i].reshape(-1, 1).copy()
+            mod.R = self.R[i].copy()
+            mod.F = self.F[i].reshape(-1, 1).copy()
+            mod.W = self.W[i].copy()
+            mod.param1 = self.param1[i]
+            mod.param2 = self.param2[i]
+            mod.t = self.t
+            if hasattr(self, 'm'):
+                mod.m = self.m[i].reshape(-1, 1).copy()
+                mod.C = self.C[i].copy()
+            if self.is_dlm:
+                mod.n = self.n[i]
+                mod.s = self.s[i]
+        return self.mod_list
+
+# Cell
+def update_batch(mod, y=None, X=None):
+
+    # If data is missing then skip discounting and updating, posterior = prior
+    y = np.asarray(y, dtype=float).reshape(-1)
+    obs = np.logical_not(np.isnan(y))
+
+    mod.update_F(X)
+
+    # Mean and variance
+    ft, qt, RF = mod.get_mean_and_var(mod.F, mod.a, mod.R)
+
+    mod.m = mod.a.copy()
+    mod.C = mod.R.copy()
+
+    if np.any(obs):
+        ft, qt, RF = ft[obs], qt[obs], RF[obs]
+
+        # Choose conjugate prior, match mean and variance (variational Bayes step)
+        param1, param2 = mod.get_conjugate_params(ft, qt, mod.param1[obs], mod.param2[obs])
+
+        # Update the conjugate parameters and get the implied ft* and qt*
+        param1, param2, ft_star, qt_star = mod.mod.update_conjugate_params(y[obs], param1, param2)
+        mod.param1[obs], mod.param2[obs] = param1, param2
+
+        # Filter update on the state vectors (using Linear Bayes approximation)
+        mod.m[obs] = mod.a[obs] + RF * ((ft_star - ft) / qt)[:, None]
+        mod.C[obs] = mod.R[obs] - RF[:, :, None] * RF[:, None, :] * ((1 - qt_star / qt) / qt)[:, None, None]
+
+    # See time t observation y (which was passed into the update function)
+    mod.t += 1
+
+    # Get priors a, R for time t + 1 from the posteriors m, C
+    mod.evolve(obs, X)
+
+# Cell
+def update_dlm_batch(mod, y=None, X=None):
+
+    # If data is missing then skip discounting and updating, posterior = prior
+    y = np.asarray(y, dtype=float).reshape(-1)
+    obs = np.logical_not(np.isnan(y))
+
+    mod.update_F(X)
+
+    # Mean and variance
+    ft, qt, RF = mod.get_mean_and_var(mod.F, mod.a, mod.R)
+
+    mod.m = mod.a.copy()
+    mod.C = mod.R.copy()
+
+    if np.any(obs):
+        ft, qt, RF = ft[obs], qt[obs], RF[obs]
+        mod.param1[obs] = ft
+        mod.param2[obs] = qt
+
+        # Update the  parameters:
+        et = y[obs] - ft
+
+        # Adaptive coefficient vectors
+        At = RF / qt[:, None]
+
+        # Volatility estimate ratio
+        n = mod.n[obs]
+        rt = (n + et ** 2 / qt) / (n + 1)
+
+        # Kalman filter update
+        mod.n[obs] = n + 1
+        mod.s[obs] = mod.s[obs] * rt
+        mod.m[obs] = mod.a[obs] + At * et[:, None]
+        mod.C[obs] = rt[:, None, None] * (mod.R[obs] - qt[:, None, None] * At[:, :, None] * At[:, None, :])
+
+    mod.t += 1
+
+    # Get priors a, R for time t + 1 from the posteriors m, C
+    mod.evolve(obs, X)
+    mod.n[obs] = mod.delVar[obs] * mod.n[obs]
+
+# Cell
+def update_bindglm_batch(mod, n=None, y=None, X=None):
+
+    # If data is missing then skip discounting and updating, posterior = prior
+    y = np.asarray(y, dtype=float).reshape(-1)
+    n = np.asarray(n, dtype=float).reshape(-1)
+    obs = np.logical_not(np.isnan(y) | np.isnan(n) | (n == 0))
+
+    mod.update_F(X)
+
+    # Mean and variance
+    ft, qt, RF = mod.get_mean_and_var(mod.F, mod.a, mod.R)
+
+    mod.m = mod.a.copy()
+    mod.C = mod.R.copy()
+
+    if np.any(obs):
+        ft, qt, RF = ft[obs], qt[obs], RF[obs]
+
+        # Choose conjugate prior, match mean and variance
+        param1, param2 = mod.get_conjugate_params(ft, qt, mod.param1[obs], mod.param2[obs])
+
+        # Update the conjugate parameters and get the implied ft* and qt*
+        param1, param2, ft_star, qt_star = mod.mod.update_conjugate_params(n[obs], y[obs], param1, param2)
+        mod.param1[obs], mod.param2[obs] = param1, param2
+
+        # Kalman filter update on the state vectors (using Linear Bayes approximation)
+        mod.m[obs] = mod.a[obs] + RF * ((ft_star - ft) / qt)[:, None]
+        mod.C[obs] = mod.R[obs] - RF[:, :, None] * RF[:, None, :] * ((1 - qt_star / qt) / qt)[:, None, None]
+
+    mod.t += 1
+
+    # Get priors a, R for time t + 1 from the posteriors m, C
+    mod.evolve(obs, X)
\ No newline at end of file
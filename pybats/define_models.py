@@ -12,8 +12,6 @@ from .dcmm import dcmm
 from .dlmm import dlmm
 from .dglm import dlm, pois_dglm, bern_dglm, bin_dglm
 
-import statsmodels.api as sm
-
 # Cell
 def define_dglm(Y, X, family="normal", n=None,
                 ntrend=1, nlf=0, nhol=0,
@@ -165,6 +163,8 @@ def define_dglm(Y, X, family="normal", n=None,
 
 # Cell
 def define_dlm_params(Y, X=None):
+    import statsmodels.api as sm
+
     n = len(Y)
     p = ncol(X)
     g = max(2, int(n / 2))
@@ -181,6 +181,8 @@ def define_dlm_params(Y, X=None):
 
 # Cell
 def define_bern_params(Y, X=None):
+    import statsmodels.api as sm
+
     n = len(Y)
     p = ncol(X)
 
@@ -208,6 +210,8 @@ def define_bern_params(Y, X=None):
 
 # Cell
 def define_bin_params(Y, n, X=None):
+    import statsmodels.api as sm
+
     n_obs = len(Y)
     p = ncol(X)
 
@@ -231,6 +235,8 @@ def define_bin_params(Y, n, X=None):
 
 # Cell
 def define_pois_params(Y, X=None):
+    import statsmodels.api as sm
+
     n = len(Y)
     p = ncol(X)
 
@@ -1,27 +1,24 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/00_dglm.ipynb (unless otherwise specified).
 
-__all__ = ['dglm', 'bern_dglm', 'pois_dglm', 'dlm', 'bin_dglm']
+__all__ = ['dglm', 'bern_dglm', 'pois_dglm', 'dlm', 'bin_dglm', 'save_models', 'load_models']
 
 # Internal Cell
-from nbdev.showdoc import *
-
-
 import numpy as np
 import scipy as sc
-import pandas as pd
+import copy
+import json
 from collections.abc import Iterable
 
 from .latent_factor_fxns import update_lf_analytic, update_lf_sample, forecast_marginal_lf_analytic, \
     forecast_marginal_lf_sample, forecast_path_lf_copula, forecast_path_lf_sample, get_mean_and_var_lf, \
     get_mean_and_var_lf_dlm, update_lf_analytic_dlm
 from .seasonal import seascomp, createFourierToSeasonalL
-from .update import update, update_dlm, update_bindglm
+from .update import update, update_dlm, update_bindglm, G_block_plan
 from .forecast import forecast_marginal, forecast_path, forecast_path_copula,\
     forecast_marginal_bindglm, forecast_path_dlm, forecast_state_mean_and_var
-from .conjugates import trigamma, bern_conjugate_params, bin_conjugate_params, pois_conjugate_params
+from .conjugates import digamma_trigamma, bern_conjugate_params, bin_conjugate_params, pois_conjugate_params
 
 # These are for the bernoulli and Poisson DGLMs
-from scipy.special import digamma
 from scipy.special import beta as beta_fxn
 from scipy import stats
 
@@ -140,9 +137,12 @@ class dglm:
             self.ilf = list(range(i, i + nlf))
             i += nlf
 
-        # Combine the F and G components together
+        # Combine the F and G components together. G is block diagonal: keep the blocks, with a 2x2 block for each
+        # seasonal harmonic, so the evolution can skip the identity blocks
         F = np.vstack([Ftrend, Fregn, Fhol, Fseas, Flf])
-        G = sc.linalg.block_diag(Gtrend, Gregn, Ghol, Gseas, Glf)
+        G_blocks = [Gtrend, Gregn, Ghol, *[Gseas[j:j+2, j:j+2] for j in range(0, nseas, 2)], Glf]
+        G_blocks = [Gb for Gb in G_blocks if Gb.size > 0]
+        G = sc.linalg.block_diag(*G_blocks)
 
         # store the discount info
         self.deltrend = deltrend
@@ -177,12 +177,21 @@ class dglm:
         self.seasHarmComponents = seasHarmComponents
         self.F = F
         self.G = G
+        self.G_blocks = G_blocks
+        self.G_plan = (G, G_block_plan(G_blocks))
         self.a = a0.reshape(-1, 1)
         self.R = R0
         self.t = 0
         self.interpolate = interpolate
         self.W = self.get_W()
 
+    def __getstate__(self):
+        # Values cached for speed are rebuilt on demand, so they are left out of pickles and copies
+        state = self.__dict__.copy()
+        for name in ['G_powers', 'update_buffers', 'forecast_aR_cache', 'forecast_conj_cache']:
+            state.pop(name, None)
+        return state
+
     def build_discount_matrix(self, X=None, phi_mu=None):
         # build up discount factors while possibly taking special care to not discount when the "regn"
         # type factors are zero
@@ -262,7 +271,8 @@ class dglm:
                           phi_mu = None, phi_sigma=None, analytic=True, phi_samps=None,
                           state_mean_var=False, y=None):
         """
-        Simulate from the forecast distribution at time *t+k*.
+        Simulate from the forecast distribution at time *t+k*. k can also be an array of horizons, with one row of X per
+        horizon. Then the samples are returned as an nsamps x len(k) array, or the means as a 1 x len(k) array.
         """
 
         if self.latent_factor:
@@ -316,9 +326,13 @@ class dglm:
         return forecast_state_mean_and_var(self, k, X)
 
     def get_mean_and_var(self, F, a, R):
-        mean, var = F.T @ a, F.T @ R @ F / self.rho
+        mean, var = F.T @ a, self.get_qt(F.T @ R @ F)
         return np.ravel(mean)[0], np.ravel(var)[0]
 
+    def get_qt(self, var):
+        # Variance of the linear predictor, given the variance F.T @ R @ F from the state vector
+        return var / self.rho
+
     def get_mean_and_var_lf(self, F, a, R, phi_mu, phi_sigma, ilf):
         return get_mean_and_var_lf(self, F, a, R, phi_mu, phi_sigma, ilf)
 
@@ -329,11 +343,17 @@ class dglm:
             diag = np.round(diag + (1 - diag) * np.exp(-self.k * info), 5)
             Discount = np.ones(self.Discount.shape)
             np.fill_diagonal(Discount, diag)
-        elif self.adapt_discount == 'positive_regn' and X is not None:
-            Discount = self.build_discount_matrix(X)
         else:
             Discount = self.Discount
-        return self.R / Discount - self.R
+        W = self.R / Discount - self.R
+
+        if self.adapt_discount == 'positive_regn' and X is not None and self.nregn > 0:
+            # Don't discount the regression and holiday coefficients whose predictor is 0. This is the same as
+            # setting their rows and columns of the discount matrix to 1 (see build_discount_matrix)
+            zero = np.asarray(self.iregn)[np.ravel(X)[:self.nregn] == 0]
+            W[zero, :] = 0
+            W[:, zero] = 0
+        return W
 
     def get_coef(self, component=None):
         """Return the coefficient (state vector) means and standard deviations.
@@ -342,7 +362,7 @@ class dglm:
 
         Otherwise, specify a single component from 'trend', 'regn', 'seas', 'hol', and 'lf'.
         """
-
+        import pandas as pd
 
         trend_names = ['Intercept', 'Local Slope'][:self.ntrend]
         regn_names = ['Regn ' + str(i) for i in range(1, self.nregn_exhol+1)]
@@ -409,12 +429,13 @@ class bern_dglm(dglm):
         beta = beta + 1 - y
 
         # Get updated ft* and qt*
-        ft_star = digamma(alpha) - digamma(beta)
-        qt_star = trigamma(alpha) + trigamma(beta)
+        (psi_alpha, psi1_alpha), (psi_beta, psi1_beta) = digamma_trigamma(alpha), digamma_trigamma(beta)
+        ft_star = psi_alpha - psi_beta
+        qt_star = psi1_alpha + psi1_beta
 
         # constrain this thing from going to crazy places
-        ft_star = max(-8, min(ft_star, 8))
-        qt_star = max(0.001 ** 2, min(qt_star, 4 ** 2))
+        ft_star = np.clip(ft_star, -8, 8)
+        qt_star = np.clip(qt_star, 0.001 ** 2, 4 ** 2)
 
         return alpha, beta, ft_star, qt_star
 
@@ -444,7 +465,7 @@ class bern_dglm(dglm):
         return stats.bernoulli.logpmf(y, alpha / (alpha + beta))
 
     def get_mean(self, alpha, beta):
-        return np.ravel(alpha / (alpha + beta))[0]
+        return np.squeeze(alpha / (alpha + beta))[()]
 
     def get_prior_var(self, alpha, beta):
         return (alpha * beta) / ((alpha + beta) ** 2 * (alpha + beta + 1))
@@ -458,15 +479,15 @@ class pois_dglm(dglm):
 
     def update_conjugate_params(self, y, alpha, beta):
         # Update alpha and beta to the conjugate posterior coefficients
-        alpha = alpha + float(y)
+        alpha = alpha + np.asarray(y, dtype=float).squeeze()
         beta = beta + 1
 
         # Get updated ft* and qt*
-        ft_star = digamma(alpha) - np.log(beta)
-        qt_star = trigamma(alpha)
+        ft_star, qt_star = digamma_trigamma(alpha)
+        ft_star = ft_star - np.log(beta)
 
         # constrain this thing from going to crazy places?
-        qt_star = max(0.001 ** 2, min(qt_star, 4 ** 2))
+        qt_star = np.clip(qt_star, 0.001 ** 2, 4 ** 2)
 
         return alpha, beta, ft_star, qt_star
 
@@ -495,7 +516,7 @@ class pois_dglm(dglm):
         return stats.nbinom.logpmf(y, alpha, beta / (1 + beta))
 
     def get_mean(self, alpha, beta):
-        return np.ravel(alpha/beta)[0]
+        return np.squeeze(alpha/beta)[()]
 
     def get_prior_var(self, alpha, beta):
         return alpha / beta ** 2
@@ -510,7 +531,10 @@ class dlm(dglm):
         super().__init__(*args, **kwargs)
 
     def get_mean_and_var(self, F, a, R):
-        return F.T @ a, F.T @ R @ F + self.s
+        return F.T @ a, self.get_qt(F.T @ R @ F)
+
+    def get_qt(self, var):
+        return var + self.s
 
     def get_mean_and_var_lf(self, F, a, R, phi_mu, phi_sigma, ilf):
         ct = self.n / (self.n - 2)
@@ -519,7 +543,7 @@ class dlm(dglm):
         return ft, qt
 
     def get_mean(self, ft, qt):
-        return np.ravel(ft)[0]
+        return np.squeeze(ft)[()]
 
     def get_conjugate_params(self, ft, qt, mean, var):
         return ft, qt
@@ -564,12 +588,13 @@ class bin_dglm(dglm):
         beta = beta + n - y
 
         # Get updated ft* and qt*
-        ft_star = digamma(alpha) - digamma(beta)
-        qt_star = trigamma(alpha) + trigamma(beta)
+        (psi_alpha, psi1_alpha), (psi_beta, psi1_beta) = digamma_trigamma(alpha), digamma_trigamma(beta)
+        ft_star = psi_alpha - psi_beta
+        qt_star = psi1_alpha + psi1_beta
 
         # constrain this thing from going to crazy places?
-        ft_star = max(-8, min(ft_star, 8))
-        qt_star = max(0.001 ** 2, min(qt_star, 4 ** 2))
+        ft_star = np.clip(ft_star, -8, 8)
+        qt_star = np.clip(qt_star, 0.001 ** 2, 4 ** 2)
 
         return alpha, beta, ft_star, qt_star
 
@@ -594,7 +619,7 @@ class bin_dglm(dglm):
         return stats.binom.logpmf(y, n, alpha / (alpha + beta))
 
     def get_mean(self, n, alpha, beta):
-        return np.ravel(n * (alpha / (alpha + beta)))[0]
+        return np.squeeze(n * (alpha / (alpha + beta)))[()]
 
     def get_prior_var(self, alpha, beta):
         return (alpha * beta) / ((alpha + beta) ** 2 * (alpha + beta + 1))
@@ -603,4 +628,98 @@ class bin_dglm(dglm):
         update_bindglm(self, n, y, X)
 
     def forecast_marginal(self, n, k, X=None, nsamps=1, mean_only=False):
-        return forecast_marginal_bindglm(self, n, k, X, nsamps, mean_only)
\ No newline at end of file
+        return forecast_marginal_bindglm(self, n, k, X, nsamps, mean_only)
+
+# Internal Cell
+snapshot_version = 1
+
+
+def model_config(mod):
+    # The constructor arguments that define the structure of a model, everything except its current state
+    config = {'class': type(mod).__name__, 'ntrend': mod.ntrend, 'nregn': mod.nregn_exhol, 'nhol': mod.nhol,
+              'nlf': mod.nlf, 'seasPeriods': list(mod.seasPeriods), 'seasHarmComponents': list(map(list, mod.seasHarmComponents)),
+              'deltrend': mod.deltrend, 'delregn': mod.delregn, 'delhol': mod.delhol, 'delseas': mod.delseas,
+              'dellf': mod.dellf, 'rho': mod.rho, 'interpolate': mod.interpolate, 'adapt_discount': mod.adapt_discount,
+              'adapt_factor': mod.k, 'discount_forecast': mod.discount_forecast}
+    if isinstance(mod, dlm):
+        config['delVar'] = mod.delVar
+    return json.dumps(config, sort_keys=True, default=lambda x: np.asarray(x).tolist())
+
+# Cell
+def save_models(mod_list, filename):
+    """
+    Save the current state of a list of DGLMs into a single .npz file.
+
+    Only the state (a, R, F, param1, param2, t, and n, s for a DLM) and the arguments needed to rebuild each model are
+    saved, without pickling the model objects. Models with the same structure are stored together in stacked arrays.
+
+    :param mod_list: List of DGLMs, or a single DGLM
+    :param filename: Name of the file. The '.npz' extension is added if it is missing
+    """
+    if isinstance(mod_list, dglm):
+        mod_list = [mod_list]
+    if not all(isinstance(mod, dglm) for mod in mod_list):
+        raise ValueError('Error: Only DGLMs can be saved with save_models')
+
+    configs = {}
+    group = np.array([configs.setdefault(model_config(mod), len(configs)) for mod in mod_list], dtype=int)
+    arrays = {'version': snapshot_version, 'configs': np.array(list(configs), dtype=str), 'group': group}
+
+    for g, config in enumerate(configs):
+        mods = [mod for mod, i in zip(mod_list, group) if i == g]
+        arrays.update({'a_%d' % g: np.stack([np.ravel(mod.a) for mod in mods]),
+                       'R_%d' % g: np.stack([mod.R for mod in mods]),
+                       'F_%d' % g: np.stack([np.ravel(mod.F) for mod in mods]),
+                       'param1_%d' % g: np.array([np.ravel(mod.param1)[0] for mod in mods], dtype=float),
+                       'param2_%d' % g: np.array([np.ravel(mod.param2)[0] for mod in mods], dtype=float),
+                       't_%d' % g: np.array([mod.t for mod in mods], dtype=int)})
+        # W is only used after loading if the forecasts are discounted, otherwise it is recomputed at the next update
+        if mods[0].discount_forecast:
+            arrays['W_%d' % g] = np.stack([mod.W for mod in mods])
+        if isinstance(mods[0], dlm):
+            arrays['n_%d' % g] = np.array([np.ravel(mod.n)[0] for mod in mods], dtype=float)
+            arrays['s_%d' % g] = np.array([np.ravel(mod.s)[0] for mod in mods], dtype=float)
+
+    np.savez(filename, **arrays)
+
+# Cell
+def load_models(filename):
+    """
+    Load a list of DGLMs that was saved with `save_models`.
+
+    :param filename: Name of the .npz file
+    :return: List of DGLMs, in the order that they were saved
+    """
+    model_classes = {cls.__name__: cls for cls in [bern_dglm, pois_dglm, dlm, bin_dglm]}
+
+    with np.load(filename, allow_pickle=False) as data:
+        if int(data['version']) > snapshot_version:
+            raise ValueError('Error: The file was saved with a newer snapshot version (' + str(int(data['version'])) +
+                             ') than this version of PyBATS can read (' + str(snapshot_version) + ')')
+        group = data['group']
+        mod_list = [None] * len(group)
+
+        for g, config in enumerate(data['configs']):
+            config = json.loads(config)
+            cls = model_classes[config.pop('class')]
+            state = {name: data['%s_%d' % (name, g)] for name in ['a', 'R', 'F', 'param1', 'param2', 't', 'W', 'n', 's']
+                     if '%s_%d' % (name, g) in data.files}
+
+            # Build the model structure once, and copy it for each of the models with this structure
+            p = state['a'].shape[1]
+            template = cls(a0=np.zeros(p), R0=np.identity(p), **config)
+            for j, i in enumerate(np.flatnonzero(group == g)):
+                mod = copy.copy(template)
+                mod.a = state['a'][j].reshape(-1, 1).copy()
+                mod.R = state['R'][j].copy()
+                mod.F = state['F'][j].reshape(-1, 1).copy()
+                mod.param1 = state['param1'][j]
+                mod.param2 = state['param2'][j]
+                mod.t = int(state['t'][j])
+                if 'n' in state:
+                    mod.n = state['n'][j]
+                    mod.s = state['s'][j]
+                mod.W = state['W'][j].copy() if 'W' in state else mod.get_W()
+                mod_list[i] = mod
+
+    return mod_list
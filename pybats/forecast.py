@@ -6,18 +6,60 @@ __all__ = ['forecast_marginal', 'forecast_marginal_bindglm', 'forecast_path', 'f
 # Internal Cell
 #exporti
 import numpy as np
+import math
 from scipy import stats
 from scipy.special import gamma
 from .update import update_F
 
+# Internal Cell
+def G_power(mod, k):
+    """
+    :param mod: model
+    :param k: Power
+    :return: G^k. The powers are built lazily and cached on the model, until mod.G is replaced. They are not pickled.
+    """
+    if k < 0:
+        return np.linalg.matrix_power(mod.G, k)
+    cache = getattr(mod, 'G_powers', None)
+    if cache is None or cache[0] is not mod.G:
+        cache = mod.G_powers = (mod.G, [np.identity(mod.G.shape[0])])
+    Gk = cache[1]
+    while len(Gk) <= k:
+        Gk.append(mod.G @ Gk[-1])
+    return Gk[k]
+
+# Internal Cell
+def state_cache(mod, name):
+    """
+    :param mod: model
+    :param name: Name of the cache on the model
+    :return: Dictionary for values that only depend on the current state a, R (and W, when it is used in forecasting).
+    It is emptied by an update, and when a, R or W are replaced or edited in place, e.g. by an intervention.
+    """
+    state = (mod.a, mod.R, mod.W) if mod.discount_forecast else (mod.a, mod.R)
+    cache = getattr(mod, name, None)
+    if cache is None or len(cache[0]) != len(state) or not all(map(np.array_equal, cache[0], state)):
+        cache = (tuple(x.copy() for x in state), {})
+        setattr(mod, name, cache)
+    return cache[1]
+
 # Internal Cell
 def forecast_aR(mod, k):
-    Gk = np.linalg.matrix_power(mod.G, k - 1)
-    a = Gk @ mod.a
-    R = Gk @ mod.R @ Gk.T
-    if mod.discount_forecast:
-        R += (k - 1) * mod.W
-    return a, R
+    """
+    :param mod: model
+    :param k: Forecast horizon
+    :return: State prior mean and variance at time t + k. These only depend on the current state, so they are cached on
+    the model by horizon, until the next update.
+    """
+    cache = state_cache(mod, 'forecast_aR_cache')
+    if k not in cache:
+        Gk = G_power(mod, k - 1)
+        a = Gk @ mod.a
+        R = Gk @ mod.R @ Gk.T
+        if mod.discount_forecast:
+            R += (k - 1) * mod.W
+        cache[k] = (a, R)
+    return cache[k]
 
 # Internal Cell
 def forecast_R_cov(mod, k1, k2):
@@ -31,15 +73,122 @@ def forecast_R_cov(mod, k1, k2):
         tmp = k1
         k1 = k2
         k2 = tmp
-    Gk = np.linalg.matrix_power(mod.G, k2 - k1)
+    Gk = G_power(mod, k2 - k1)
     a, Rk1 = forecast_aR(mod, k1)
     return Gk @ Rk1
 
+# Internal Cell
+def forecast_path_cov(mod, Flist, Rlist, idx=None):
+    """
+    :param mod: model
+    :param Flist: List of the k F vectors over t+1:t+k
+    :param Rlist: List of the k state covariance matrices over t+1:t+k
+    :param idx: Optional state indices. If given, the [idx, idx] blocks of the state cross-covariances are also returned
+    :return: kxk matrix of the covariances Flist[j].T @ G^(i-j) @ Rlist[j] @ Flist[i] between horizons j < i, with a zero diagonal
+    """
+    k = len(Flist)
+    F = np.stack([np.ravel(f) for f in Flist])
+    R = np.stack(Rlist)
+    cov = np.zeros([k, k])
+    if idx is not None:
+        blocks = np.zeros([k, k, len(idx), len(idx)])
+        Gd_idx = np.identity(len(F[0]))[idx]
+
+    # Walk forward one lag at a time: row j of FG holds Flist[j].T @ G^d
+    FG = F
+    for d in range(1, k):
+        FG = FG[:k - d] @ mod.G
+        cov[np.arange(k - d), np.arange(d, k)] = np.einsum('jp,jpq,jq->j', FG, R[:k - d], F[d:])
+        if idx is not None:
+            Gd_idx = Gd_idx @ mod.G
+            blocks[np.arange(d, k), np.arange(k - d)] = np.einsum('lp,jpm->jlm', Gd_idx, R[:k - d][:, :, idx])
+
+    cov = cov + cov.T
+    if idx is not None:
+        return cov, blocks
+    return cov
+
+# Internal Cell
+def forecast_horizons_mean_and_var(mod, k, X=None):
+    """
+    :param mod: model
+    :param k: Array of forecast horizons
+    :param X: Predictors for each horizon, with one row per horizon
+    :return: Arrays of the forecast mean ft and variance qt at each horizon
+    """
+    k = np.asarray(k, dtype=int).reshape(-1)
+    F = np.repeat(mod.F.reshape(1, -1), len(k), axis=0)
+    if mod.nregn > 0:
+        F[:, mod.iregn] = np.asarray(X, dtype=float).reshape(len(k), mod.nregn)
+
+    # Row i of FG is F.T @ G^(k-1) at horizon k = k[i]. Then F.T @ a_k = FG[i] @ a and F.T @ R_k @ F = FG[i] @ R @ FG[i].T,
+    # so the p x p state variance does not need to be evolved to every horizon
+    FG = np.stack([f @ G_power(mod, h - 1) for f, h in zip(F, k)])
+    ft = FG @ mod.a.reshape(-1)
+    var = np.einsum('ip,pq,iq->i', FG, mod.R, FG)
+    if mod.discount_forecast:
+        var += (k - 1) * np.einsum('ip,pq,iq->i', F, mod.W, F)
+    return ft, np.ravel(mod.get_qt(var))
+
+# Internal Cell
+def forecast_conjugate_params(mod, k, ft, qt):
+    """
+    :param mod: model
+    :param k: Forecast horizon, or an array of horizons
+    :param ft: Forecast mean at each horizon
+    :param qt: Forecast variance at each horizon
+    :return: Conjugate parameters at each horizon, with the shape of ft. They are cached on the model by horizon, along
+    with the ft and qt they were solved for, until the next update. So the marginal and path forecasts made at one time
+    step share their solves.
+    """
+    cache = state_cache(mod, 'forecast_conj_cache')
+
+    shape = np.shape(ft)
+    k = np.ravel(k).tolist()
+    ft, qt = np.ravel(ft).astype(float), np.ravel(qt).astype(float)
+    param1, param2 = np.empty(len(k)), np.empty(len(k))
+
+    # The cached parameters are reused if ft and qt match, up to rounding from the different ways of computing them
+    solve = []
+    for i, h in enumerate(k):
+        hit = cache.get(h)
+        if hit is not None and math.isclose(hit[0], ft[i], rel_tol=1e-12, abs_tol=1e-14) and \
+                math.isclose(hit[1], qt[i], rel_tol=1e-12):
+            param1[i], param2[i] = hit[2:]
+        else:
+            solve.append(i)
+
+    if solve:
+        p1, p2 = mod.get_conjugate_params(ft[solve], qt[solve], mod.param1, mod.param2)
+        param1[solve], param2[solve] = np.ravel(p1), np.ravel(p2)
+        for i in solve:
+            cache[k[i]] = (ft[i], qt[i], param1[i], param2[i])
+
+    return param1.reshape(shape), param2.reshape(shape)
+
 # Cell
 def forecast_marginal(mod, k, X = None, nsamps = 1, mean_only = False, state_mean_var = False, y=None):
     """
-    Marginal forecast function k steps ahead
+    Marginal forecast function k steps ahead. If k is an array of horizons, then X has one row per horizon, and the
+    forecasts for all of the horizons are returned together: an nsamps x len(k) array of samples (1 x len(k) if
+    mean_only=True), or arrays of ft, qt and the log-likelihood of y (with one value per horizon). The samples for all
+    of the horizons are drawn in one call, so under a fixed seed they differ from separate forecasts at each horizon.
     """
+    if np.ndim(k) > 0:
+        ft, qt = forecast_horizons_mean_and_var(mod, k, X)
+        if state_mean_var:
+            return ft, qt
+
+        param1, param2 = forecast_conjugate_params(mod, k, ft, qt)
+        param1, param2 = np.ravel(param1), np.ravel(param2)
+        if y is not None:
+            return np.ravel(mod.loglik(y, param1, param2))
+        if mean_only:
+            return np.reshape(mod.get_mean(param1, param2), [1, -1])
+        # Each row of samples repeats the parameters for every horizon
+        return np.reshape(mod.simulate(np.tile(param1, nsamps), np.tile(param2, nsamps), nsamps * len(param1)),
+                          [nsamps, -1])
+
     # Plug in the correct F values
     F = update_F(mod, X, F=mod.F.copy())
 
@@ -53,7 +202,7 @@ def forecast_marginal(mod, k, X = None, nsamps = 1, mean_only = False, state_mea
         return ft, qt
 
     # Choose conjugate prior, match mean and variance
-    param1, param2 = mod.get_conjugate_params(ft, qt, mod.param1, mod.param2)
+    param1, param2 = forecast_conjugate_params(mod, k, ft, qt)
 
     if y is not None:
         return mod.loglik(y, param1, param2)
@@ -67,8 +216,20 @@ def forecast_marginal(mod, k, X = None, nsamps = 1, mean_only = False, state_mea
 # Cell
 def forecast_marginal_bindglm(mod, n, k, X=None, nsamps=1, mean_only=False):
     """
-    Marginal forecast function k steps ahead for a binomial DGLM
+    Marginal forecast function k steps ahead for a binomial DGLM. As in `forecast_marginal`, k can be an array of
+    horizons, with one value of n and one row of X per horizon.
     """
+    if np.ndim(k) > 0:
+        ft, qt = forecast_horizons_mean_and_var(mod, k, X)
+        param1, param2 = forecast_conjugate_params(mod, k, ft, qt)
+        param1, param2 = np.ravel(param1), np.ravel(param2)
+        n = np.broadcast_to(np.asarray(n, dtype=float).reshape(-1), param1.shape)
+        if mean_only:
+            return np.reshape(mod.get_mean(n, param1, param2), [1, -1])
+        # Each row of samples repeats the parameters for every horizon
+        return np.reshape(mod.simulate(np.tile(n, nsamps), np.tile(param1, nsamps), np.tile(param2, nsamps),
+                                       nsamps * len(param1)), [nsamps, -1])
+
     # Plug in the correct F values
     F = update_F(mod, X, F=mod.F.copy())
     # F = np.copy(mod.F)
@@ -82,7 +243,7 @@ def forecast_marginal_bindglm(mod, n, k, X=None, nsamps=1, mean_only=False):
     ft, qt = mod.get_mean_and_var(F, a, R)
 
     # Choose conjugate prior, match mean and variance
-    param1, param2 = mod.get_conjugate_params(ft, qt, mod.param1, mod.param2)
+    param1, param2 = forecast_conjugate_params(mod, k, ft, qt)
 
     if mean_only:
         return mod.get_mean(n, param1, param2)
@@ -119,45 +280,47 @@ def forecast_path(mod, k, X = None, nsamps = 1):
 
     F = np.copy(mod.F)
 
-    for n in range(nsamps):
-        param1 = mod.param1
-        param2 = mod.param2
+    # All nsamps trajectories are simulated together, each with its own state mean and covariance
+    param1 = np.broadcast_to(np.ravel(mod.param1)[0], [nsamps])
+    param2 = np.broadcast_to(np.ravel(mod.param2)[0], [nsamps])
 
-        a = np.copy(mod.a)
-        R = np.copy(mod.R)
+    a = np.tile(np.ravel(mod.a), [nsamps, 1])
+    R = np.tile(mod.R, [nsamps, 1, 1])
 
-        for i in range(k):
+    for i in range(k):
 
-            # Plug in the correct F values
-            if mod.nregn > 0:
-                F = update_F(mod, X[i,:], F=F)
-            # if mod.nregn > 0:
-            #     F[mod.iregn] = X[i,:].reshape(mod.nregn,1)
+        # Plug in the correct F values
+        if mod.nregn > 0:
+            F = update_F(mod, X[i,:], F=F)
+        f = np.ravel(F)
 
-            # Get mean and variance
-            ft, qt = mod.get_mean_and_var(F, a, R)
+        # Get mean and variance
+        RF = R @ f
+        ft = a @ f
+        qt = mod.get_qt(RF @ f)
 
-            # Choose conjugate prior, match mean and variance
-            param1, param2 = mod.get_conjugate_params(ft, qt, param1, param2)
+        # Choose conjugate prior, match mean and variance
+        param1, param2 = mod.get_conjugate_params(ft, qt, param1, param2)
+        param1, param2 = np.reshape(param1, [nsamps]), np.reshape(param2, [nsamps])
 
-            # Simulate next observation
-            samps[n, i] = mod.simulate(param1, param2, nsamps = 1)
+        # Simulate next observation
+        samps[:, i] = mod.simulate(param1, param2, nsamps = nsamps)
 
-            # Update based on that observation
-            param1, param2, ft_star, qt_star = mod.update_conjugate_params(samps[n, i], param1, param2)
+        # Update based on that observation
+        param1, param2, ft_star, qt_star = mod.update_conjugate_params(samps[:, i], param1, param2)
 
-            # Kalman filter update on the state vector (using Linear Bayes approximation)
-            m = a + R @ F * (ft_star - ft)/qt
-            C = R - R @ F @ F.T @ R * (1 - qt_star/qt)/qt
+        # Kalman filter update on the state vector (using Linear Bayes approximation)
+        m = a + RF * ((ft_star - ft)/qt)[:, None]
+        C = R - RF[:, :, None] * RF[:, None, :] * ((1 - qt_star/qt)/qt)[:, None, None]
 
-            # Get priors a, R for the next time step
-            a = mod.G @ m
-            R = mod.G @ C @ mod.G.T
-            R = (R + R.T)/2
+        # Get priors a, R for the next time step
+        a = m @ mod.G.T
+        R = mod.G @ C @ mod.G.T
+        R = (R + R.transpose(0, 2, 1))/2
 
-            # Discount information
-            if mod.discount_forecast:
-                R = R + mod.W
+        # Discount information
+        if mod.discount_forecast:
+            R = R + mod.W
 
     return samps
 
@@ -195,12 +358,8 @@ def forecast_path_copula(mod, k, X = None, nsamps = 1, t_dist=False, y=None, nu=
         lambda_mu[i] = ft
         lambda_cov[i,i] = qt
 
-        # Find covariances with previous lambda values
-        for j in range(i):
-            # Covariance matrix between the state vector at times j, i, i > j
-            cov_ij = np.linalg.matrix_power(mod.G, i-j) @ Rlist[j]
-            # Covariance between lambda at times j, i
-            lambda_cov[j,i] = lambda_cov[i,j] = Flist[j].T @ cov_ij @ Flist[i]
+    # Find covariances between the lambda values at different horizons
+    lambda_cov += forecast_path_cov(mod, Flist, Rlist)
 
     if return_cov:
         return lambda_cov
@@ -244,12 +403,8 @@ def forecast_path_dlm(mod, k, X=None, nsamps=1, approx=True):
             mean[i] = ft
             cov[i, i] = qt
 
-            # Find covariances with previous lambda values
-            for j in range(i):
-                # Covariance matrix between the state vector at times j, i, i > j
-                cov_ij = np.linalg.matrix_power(mod.G, i - j) @ Rlist[j]
-                # Covariance between lambda at times j, i
-                cov[j, i] = cov[i, j] = Flist[j].T @ cov_ij @ Flist[i]
+        # Find covariances between the forecasts at different horizons
+        cov += forecast_path_cov(mod, Flist, Rlist)
 
         return multivariate_t(mean, cov, mod.n, nsamps)
 
@@ -292,39 +447,43 @@ def forecast_path_dlm(mod, k, X=None, nsamps=1, approx=True):
         return samps
 
 # Internal Cell
-def forecast_path_copula_sim(mod, k, lambda_mu, lambda_cov, nsamps, t_dist = False, nu = 9):
+def copula_uniform_samples(lambda_mu, lambda_cov, nsamps, t_dist = False, nu = 9):
     """
     lambda_mu: kx1 Mean vector for forecast mean over t+1:t+k
     lambda_cov: kxk Covariance matrix for the forecast over t+1:t+k
+    Returns a k x nsamps array of joint samples, mapped onto uniform RVs by the marginal CDF of each row
     """
+    lambda_mu = np.ravel(lambda_mu)
 
     if t_dist:
         #nu = 8
         scale = lambda_cov * ((nu - 2) / nu)
         joint_samps = multivariate_t(lambda_mu, scale, nu, nsamps).T
-        genlist = list(map(lambda f, q: stats.t(loc = f, scale = np.sqrt(q), df = nu),
-                      lambda_mu, np.diag(scale)))
+        return stats.t.cdf((joint_samps - lambda_mu[:, None]) / np.sqrt(np.diag(scale))[:, None], df=nu)
     else:
         # Simulate from a joint multivariate normal with lambda_mu, lambda_cov
         joint_samps = np.random.multivariate_normal(lambda_mu, lambda_cov, size=nsamps).T
-        genlist = list(map(lambda f, q: stats.norm(f, np.sqrt(q)),
-                      lambda_mu, np.diag(lambda_cov)))
+        return stats.norm.cdf((joint_samps - lambda_mu[:, None]) / np.sqrt(np.diag(lambda_cov))[:, None])
 
-    # Find the marginal conjugate parameters
-    conj_params = list(map(lambda f, q: mod.get_conjugate_params(f, q, mod.param1, mod.param2),
-                           lambda_mu, np.diag(lambda_cov)))
+# Internal Cell
+def forecast_path_copula_sim(mod, k, lambda_mu, lambda_cov, nsamps, t_dist = False, nu = 9):
+    """
+    lambda_mu: kx1 Mean vector for forecast mean over t+1:t+k
+    lambda_cov: kxk Covariance matrix for the forecast over t+1:t+k
+    """
 
     # Use the marginal CDF of the joint distribution to convert our samples into uniform RVs
-    unif_rvs = list(map(lambda gen, samps: gen.cdf(samps),
-              genlist, joint_samps))
+    unif_rvs = copula_uniform_samples(lambda_mu, lambda_cov, nsamps, t_dist, nu)
+
+    # Find the marginal conjugate parameters for all k horizons at once
+    param1, param2 = forecast_conjugate_params(mod, np.arange(1, k + 1), np.ravel(lambda_mu), np.diag(lambda_cov))
+    param1, param2 = np.reshape(param1, [-1, 1]), np.reshape(param2, [-1, 1])
 
     # Use inverse-CDF along each margin to get implied PRIOR value (e.g. a gamma dist RV for a poisson sampling model)
-    priorlist = list(map(lambda params, unif_rv: mod.prior_inverse_cdf(unif_rv, params[0], params[1]),
-                    conj_params, unif_rvs))
+    prior = mod.prior_inverse_cdf(unif_rvs, param1, param2)
 
     # Simulate from the sampling model (e.g. poisson)
-    return np.array(list(map(lambda prior: mod.simulate_from_sampling_model(prior, nsamps),
-            priorlist))).T
+    return mod.simulate_from_sampling_model(prior.ravel(), prior.size).reshape(prior.shape).T
 
 # Internal Cell
 def forecast_path_copula_density_MC(mod, y, lambda_mu, lambda_cov, t_dist=False, nu = 9, nsamps = 500):
@@ -332,43 +491,29 @@ def forecast_path_copula_density_MC(mod, y, lambda_mu, lambda_cov, t_dist=False,
     Find the density of a sequence of future observations y
     """
     not_missing = np.logical_not(np.isnan(y))
+    horizons = np.arange(1, len(y) + 1)[not_missing]
     y = y[not_missing]
-    lambda_mu = lambda_mu[not_missing]
+    lambda_mu = np.ravel(lambda_mu)[not_missing]
     lambda_cov = lambda_cov[np.ix_(not_missing, not_missing)]
 
-    # Get the marginals of the multivariate distribution
-    if t_dist:
-        scale = lambda_cov * ((nu - 2) / nu)
-        joint_samps = multivariate_t(lambda_mu, scale, nu, nsamps).T
-        genlist = list(map(lambda f, q: stats.t(loc=f, scale=np.sqrt(q), df=nu),
-                           lambda_mu, np.diag(scale)))
-    else:
-        joint_samps = np.random.multivariate_normal(lambda_mu, lambda_cov, size=nsamps).T
-        genlist = list(map(lambda f, q: stats.norm(f, np.sqrt(q)),
-                           lambda_mu, np.diag(lambda_cov)))
+    # Use the marginal CDF of the joint distribution to convert our samples into uniform RVs
+    unif_rvs = copula_uniform_samples(lambda_mu, lambda_cov, nsamps, t_dist, nu)
 
     # Find the marginal distribution conjugate parameters
-    conj_params = list(map(lambda f, q: mod.get_conjugate_params(f, q, mod.param1, mod.param2),
-                           lambda_mu, np.diag(lambda_cov)))
-
-    # Use the marginal CDF of the joint distribution to convert our samples into uniform RVs
-    unif_rvs = list(map(lambda gen, samps: gen.cdf(samps),
-                       genlist, joint_samps))
+    param1, param2 = forecast_conjugate_params(mod, horizons, lambda_mu, np.diag(lambda_cov))
+    param1, param2 = np.reshape(param1, [-1, 1]), np.reshape(param2, [-1, 1])
 
     # Use inverse-CDF along each margin to get implied PRIOR value (e.g. a gamma dist RV for a poisson sampling model)
-    priorlist = list(map(lambda params, cdf: mod.prior_inverse_cdf(cdf, params[0], params[1]),
-                         conj_params, unif_rvs))
+    prior = mod.prior_inverse_cdf(unif_rvs, param1, param2)
 
     # Get the density of the y values, using Monte Carlo integration (i.e. an average over the samples)
-    density_list = list(map(lambda y, prior: mod.sampling_density(y, prior),
-                            y, priorlist))
+    density = mod.sampling_density(y.reshape(-1, 1), prior)
 
     # Get the product of the densities to get the path density (they are independent, conditional upon the prior value at each time t+k)
-    path_density_list = list(map(lambda dens: np.exp(np.sum(np.log(dens))),
-                                 zip(*density_list)))
+    path_density = np.exp(np.sum(np.log(density), axis=0))
 
     # Return their average, on the log scale
-    return np.log(np.mean(path_density_list))
+    return np.log(np.mean(path_density))
 
 # Internal Cell
 def forecast_joint_copula_sim(mod_list, lambda_mu, lambda_cov, nsamps, t_dist=False, nu=9):
@@ -376,34 +521,18 @@ def forecast_joint_copula_sim(mod_list, lambda_mu, lambda_cov, nsamps, t_dist=Fa
     Jointly forecast from multiple DGLMs which share a latent factor
     """
 
-    if t_dist:
-        # nu = 8
-        scale = lambda_cov * ((nu - 2) / nu)
-        joint_samps = multivariate_t(lambda_mu, scale, nu, nsamps).T
-        genlist = list(map(lambda f, q: stats.t(loc=f, scale=np.sqrt(q), df=nu),
-                           lambda_mu, np.diag(scale)))
-    else:
-        # Simulate from a joint multivariate normal with lambda_mu, lambda_cov
-        joint_samps = np.random.multivariate_normal(lambda_mu, lambda_cov, size=nsamps).T
-        genlist = list(map(lambda f, q: stats.norm(f, np.sqrt(q)),
-                           lambda_mu, np.diag(lambda_cov)))
+    # Use the marginal CDF of the joint distribution to convert our samples into uniform RVs
+    unif_rvs = copula_uniform_samples(lambda_mu, lambda_cov, nsamps, t_dist, nu)
+
+    # If any are numerically 1 or 0, fix them:
+    unif_rvs[unif_rvs == 1] = 1 - 1E-5
+    unif_rvs[unif_rvs == 0] = 1E-5
 
     # Find the marginal conjugate parameters
     conj_params = []
     for i, mod in enumerate(mod_list):
         conj_params.append(mod.get_conjugate_params(lambda_mu[i], lambda_cov[i, i], mod.param1, mod.param2))
 
-    # Use the marginal CDF of the joint distribution to convert our samples into uniform RVs
-    unif_rvs = list(map(lambda gen, samps: gen.cdf(samps),
-                        genlist, joint_samps))
-
-    # If any are numerically 1 or 0, fix them:
-    def numeric_fix(u):
-        u[u == 1] = 1 - 1E-5
-        u[u == 0] = 1E-5
-        return u
-    unif_rvs = [numeric_fix(u) for u in unif_rvs]
-
     # Use inverse-CDF along each margin to get implied PRIOR value (e.g. a gamma dist RV for a poisson sampling model)
     priorlist = list(map(lambda mod, params, unif_rv: mod.prior_inverse_cdf(unif_rv, params[0], params[1]),
                          mod_list, conj_params, unif_rvs))
@@ -420,43 +549,31 @@ def forecast_joint_copula_density_MC(mod_list, y, lambda_mu, lambda_cov, t_dist=
     """
     not_missing = np.logical_not(np.isnan(y))
     y = y[not_missing]
-    lambda_mu = lambda_mu[not_missing]
+    lambda_mu = np.ravel(lambda_mu)[not_missing]
     lambda_cov = lambda_cov[np.ix_(not_missing, not_missing)]
+    mod_list = [mod for mod, obs in zip(mod_list, not_missing) if obs]
 
-    # Get the marginals of the multivariate distribution
-    if t_dist:
-        scale = lambda_cov * ((nu - 2) / nu)
-        joint_samps = multivariate_t(lambda_mu, scale, nu, nsamps).T
-        genlist = list(map(lambda f, q: stats.t(loc=f, scale=np.sqrt(q), df=nu),
-                           lambda_mu, np.diag(scale)))
-    else:
-        joint_samps = np.random.multivariate_normal(lambda_mu, lambda_cov, size=nsamps).T
-        genlist = list(map(lambda f, q: stats.norm(f, np.sqrt(q)),
-                           lambda_mu, np.diag(lambda_cov)))
+    # Use the marginal CDF of the joint distribution to convert our samples into uniform RVs
+    unif_rvs = copula_uniform_samples(lambda_mu, lambda_cov, nsamps, t_dist, nu)
 
     # Find the marginal distribution conjugate parameters
     conj_params = []
     for i, mod in enumerate(mod_list):
         conj_params.append(mod.get_conjugate_params(lambda_mu[i], lambda_cov[i, i], mod.param1, mod.param2))
 
-    # Use the marginal CDF of the joint distribution to convert our samples into uniform RVs
-    unif_rvs = list(map(lambda gen, samps: gen.cdf(samps),
-                       genlist, joint_samps))
-
     # Use inverse-CDF along each margin to get implied PRIOR value (e.g. a gamma dist RV for a poisson sampling model)
     priorlist = list(map(lambda mod, params, cdf: mod.prior_inverse_cdf(cdf, params[0], params[1]),
                          mod_list, conj_params, unif_rvs))
 
     # Get the density of the y values, using Monte Carlo integration (i.e. an average over the samples)
-    density_list = list(map(lambda mod, y, prior: mod.sampling_density(y, prior),
-                            mod_list, y, priorlist))
+    density = np.array(list(map(lambda mod, y, prior: mod.sampling_density(y, prior),
+                                mod_list, y, priorlist)))
 
     # Get the product of the densities to get the joint density (they are independent, conditional upon the prior value at each time t+k)
-    joint_density_list = list(map(lambda dens: np.exp(np.sum(np.log(dens))),
-                                 zip(*density_list)))
+    joint_density = np.exp(np.sum(np.log(density), axis=0))
 
     # Return their average, on the log scale
-    return np.log(np.mean(joint_density_list))
+    return np.log(np.mean(joint_density))
 
 # Internal Cell
 def multivariate_t(mean, scale, nu, nsamps):
@@ -509,7 +626,7 @@ def forecast_marginal_density_MC(mod, k, X = None, nsamps = 1, y = None):
     ft, qt = mod.get_mean_and_var(F, a, R)
 
     # Choose conjugate prior, match mean and variance
-    param1, param2 = mod.get_conjugate_params(ft, qt, mod.param1, mod.param2)
+    param1, param2 = forecast_conjugate_params(mod, k, ft, qt)
 
     # Simulate from the conjugate prior
     prior_samps = mod.simulate_from_prior(param1, param2, nsamps)
@@ -22,95 +22,163 @@ from .dcmm import dcmm
 from .forecast import forecast_aR, forecast_R_cov
 from .dglm import dlm
 
+# Internal Cell
+def store_row(arrays, dates, date_index, date, values):
+    """
+    Store values (a tuple of arrays) in the row of arrays for date, appending a new row for a new date. The row
+    capacity is doubled when it runs out.
+    """
+    if arrays is None:
+        arrays = tuple(np.zeros([8, *np.shape(x)]) for x in values)
+    i = date_index.get(date)
+    if i is None:
+        i = date_index[date] = len(dates)
+        dates.append(date)
+        if i == len(arrays[0]):
+            arrays = tuple(np.concatenate([a, np.zeros(a.shape)]) for a in arrays)
+    for a, x in zip(arrays, values):
+        a[i] = x
+    return arrays
+
+
+def read_only(x):
+    # Read-only view of a stored row. The rows can be shared with copies of the latent factor, so they must not be
+    # changed through the arrays that are returned
+    if np.ndim(x) == 0:
+        return x
+    x = x.view()
+    x.setflags(write=False)
+    return x
+
+
+def pad_forecast_cov(cov, k):
+    # The path covariances at horizons h = 1, ..., k-1 have shapes (p, p, h). Pad them to a single (k-1, p, p, k-1) array
+    if k == 1:
+        return np.zeros([0])
+    padded = np.zeros([k - 1, *np.shape(cov[0])[:-1], k - 1])
+    for h, c in enumerate(cov[:k - 1]):
+        padded[h, ..., :h + 1] = c
+    return padded
+
 # Cell
 class latent_factor:
     def __init__(self, mean={}, var={}, forecast_mean={}, forecast_var={}, forecast_cov={},
                  dates=[], forecast_dates=[],
                  gen_fxn = None, gen_forecast_fxn = None, forecast_path=False, p = None, k=None):
-
-        self.forecast_mean = forecast_mean
-        self.forecast_var = forecast_var
-        self.forecast_cov = forecast_cov
-        self.mean = mean
-        self.var = var
+        """
+        The latent factor is stored in arrays with one row per date: the mean and variance with shapes (T, p) and
+        (T, p, p), and the forecast means and variances with shapes (T, k, p) and (T, k, p, p). A dictionary maps each
+        date to its row. The mean, var and forecast_* arguments are dictionaries keyed by date.
+        """
 
         self.p = p
         self.k = k
-        self.dates = dates
-        self.forecast_dates = forecast_dates
-
-        #if len(dates) != 0:
-        #    self.start_date = np.min(dates)
-        #    self.end_date = np.max(dates)
 
-        #if len(forecast_dates) != 0:
-        #    self.forecast_start_date = np.min(forecast_dates)
-        #    self.forecast_end_date = np.max(forecast_dates)
-
-        if len(mean) != 0 and len(dates) != 0:
-            if len(dates) != len(mean):
-                print('Error: Dates should have the same length as the latent factor')
-            #if isinstance(mean[0], Iterable):
-            #    self.p = len(mean[0])
-            #else:
-            #    self.p = 1
-            self.k = len(forecast_mean[dates[0]]) # forecast length
         self.gen_fxn = gen_fxn
         self.gen_forecast_fxn = gen_forecast_fxn
 
         self.forecast_path = forecast_path
 
+        # Row index for each date, and the stored arrays. The arrays are allocated on the first date stored.
+        self.dates = []
+        self.forecast_dates = []
+        self.date_index = {}
+        self.forecast_date_index = {}
+        self.lf_arrays = None
+        self.forecast_arrays = None
+        self.shared = False
+
+        if len(mean) != 0:
+            if len(dates) == 0:
+                dates = list(mean.keys())
+            elif len(dates) != len(mean):
+                print('Error: Dates should have the same length as the latent factor')
+            for date in dates:
+                self.set_lf(date, mean[date], var[date])
+
+        if len(forecast_mean) != 0:
+            if len(forecast_dates) == 0:
+                forecast_dates = list(forecast_mean.keys())
+            for date in forecast_dates:
+                if self.forecast_path:
+                    self.set_lf_forecast(date, forecast_mean[date], forecast_var[date], forecast_cov[date])
+                else:
+                    self.set_lf_forecast(date, forecast_mean[date], forecast_var[date])
+
     def get_lf(self, date):
-        return self.mean[date], self.var[date]
+        i = self.date_index[date]
+        return read_only(self.lf_arrays[0][i]), read_only(self.lf_arrays[1][i])
 
     def get_lf_forecast(self, date):
+        i = self.forecast_date_index[date]
+        m, v = read_only(self.forecast_arrays[0][i]), read_only(self.forecast_arrays[1][i])
         if self.forecast_path:
-            return self.forecast_mean[date], self.forecast_var[date], self.forecast_cov[date]
+            cov = read_only(self.forecast_arrays[2][i])
+            return m, v, [cov[h - 1, ..., :h] for h in range(1, self.k)]
         else:
-            return self.forecast_mean[date], self.forecast_var[date]
+            return m, v
 
-    def generate_lf(self, date, **kwargs):
-        m, v = self.gen_fxn(date, **kwargs)
-        self.mean.update({date:m})
-        self.var.update({date:v})
+    def get_lf_range(self, start_date, end_date):
+        """
+        :return: Mean and variance arrays for the rows from start_date to end_date (inclusive), in the order they were
+        generated. These are read-only views of the stored arrays, not copies.
+        """
+        i, j = self.date_index[start_date], self.date_index[end_date] + 1
+        return read_only(self.lf_arrays[0][i:j]), read_only(self.lf_arrays[1][i:j])
+
+    def get_lf_forecast_range(self, start_date, end_date):
+        """
+        :return: Forecast mean and variance arrays for the rows from start_date to end_date (inclusive), in the order
+        they were generated. These are read-only views of the stored arrays, not copies.
+        """
+        i, j = self.forecast_date_index[start_date], self.forecast_date_index[end_date] + 1
+        return read_only(self.forecast_arrays[0][i:j]), read_only(self.forecast_arrays[1][i:j])
+
+    def set_lf(self, date, m, v):
         if self.p is None:
             if type(m) == np.ndarray:
                 self.p = len(m)
             else:
                 self.p = 1
 
-        self.dates.append(date)
-        #self.start_date = np.min(self.dates)
-        #self.end_date = np.max(self.dates)
+        self.unshare()
+        self.lf_arrays = store_row(self.lf_arrays, self.dates, self.date_index, date, (m, v))
+
+    def set_lf_forecast(self, date, m, v, cov=None):
+        if self.k is None:
+            self.k = len(m)
+
+        self.unshare()
+        values = (m, v) if cov is None else (m, v, pad_forecast_cov(cov, self.k))
+        self.forecast_arrays = store_row(self.forecast_arrays, self.forecast_dates, self.forecast_date_index,
+                                         date, values)
 
-        # m = pd.Series({date:m})
-        # v = pd.Series({date:v})
-        # self.mean = self.mean.append(m)
-        # self.var = self.var.append(v)
+    def generate_lf(self, date, **kwargs):
+        m, v = self.gen_fxn(date, **kwargs)
+        self.set_lf(date, m, v)
 
     def generate_lf_forecast(self, date, **kwargs):
         if self.forecast_path:
             m, v, cov = self.gen_forecast_fxn(date, forecast_path=self.forecast_path, **kwargs)
-            self.forecast_cov.update({date:cov})
+            self.set_lf_forecast(date, m, v, cov)
         else:
             m, v = self.gen_forecast_fxn(date, forecast_path=self.forecast_path, **kwargs)
-
-        self.forecast_mean.update({date:m})
-        self.forecast_var.update({date:v})
-        if self.k is None:
-            self.k = len(m)
-
-        self.forecast_dates.append(date)
-        #self.forecast_start_date = np.min(self.forecast_dates)
-        #self.forecast_end_date = np.max(self.forecast_dates)
-
-        # m = pd.Series({date:m})
-        # v = pd.Series({date:v})
-        # self.forecast_mean = self.forecast_mean.append(m)
-        # self.forecast_var = self.forecast_var.append(v)
+            self.set_lf_forecast(date, m, v)
+
+    def unshare(self):
+        # Copy on write: the arrays of a copied latent factor are shared until one of the two stores a new date
+        if self.shared:
+            self.shared = False
+            self.dates, self.forecast_dates = list(self.dates), list(self.forecast_dates)
+            self.date_index, self.forecast_date_index = dict(self.date_index), dict(self.forecast_date_index)
+            if self.lf_arrays is not None:
+                self.lf_arrays = tuple(a.copy() for a in self.lf_arrays)
+            if self.forecast_arrays is not None:
+                self.forecast_arrays = tuple(a.copy() for a in self.forecast_arrays)
 
     def copy(self):
-        newlf = copy.deepcopy(self)
+        newlf = copy.copy(self)
+        self.shared = newlf.shared = True
 
         return newlf
 
@@ -118,6 +186,15 @@ class latent_factor:
         file = open(filename, "wb")
         pickle.dump(self, file=file)
 
+    def __setstate__(self, state):
+        # Latent factors pickled before the array store was added keep their values in dictionaries keyed by date
+        if 'lf_arrays' in state or 'latent_factors' in state:
+            self.__dict__.update(state)
+        else:
+            self.__init__(state['mean'], state['var'], state['forecast_mean'], state['forecast_var'],
+                          state['forecast_cov'], state['dates'], state['forecast_dates'], state['gen_fxn'],
+                          state['gen_forecast_fxn'], state['forecast_path'], state['p'], state['k'])
+
     @classmethod
     def load_latent_factor(filename):
         file = open(filename, 'rb')
@@ -1,18 +1,21 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/14_latent_factor_fxns.ipynb (unless otherwise specified).
 
 __all__ = ['update_lf_analytic', 'update_lf_analytic_dlm', 'forecast_marginal_lf_analytic', 'forecast_path_lf_copula',
-           'update_lf_sample', 'update_lf_sample_forwardfilt', 'forecast_marginal_lf_sample', 'forecast_path_lf_sample',
-           'forecast_joint_marginal_lf_copula', 'forecast_joint_marginal_lf_copula_dcmm', 'forecast_marginal_lf_dcmm',
-           'forecast_path_lf_dcmm']
+           'shutdown_lf_pools', 'update_lf_sample', 'update_lf_sample_batch', 'update_lf_sample_forwardfilt',
+           'forecast_marginal_lf_sample', 'forecast_path_lf_sample', 'forecast_joint_marginal_lf_copula',
+           'forecast_joint_marginal_lf_copula_dcmm', 'forecast_marginal_lf_dcmm', 'forecast_path_lf_dcmm']
 
 # Internal Cell
 #exporti
 import numpy as np
 
 from .forecast import forecast_path_copula_sim, forecast_path_copula_density_MC, forecast_aR, \
-    forecast_joint_copula_density_MC, forecast_joint_copula_sim
-from .update import update_F
+    forecast_joint_copula_density_MC, forecast_joint_copula_sim, forecast_path_cov
+from .update import update_F, clear_forecast_cache
+from scipy.special import logsumexp
 import multiprocessing
+import os
+import atexit
 from functools import partial
 
 # Internal Cell
@@ -27,7 +30,7 @@ def update_F_lf(mod, phi, F=None):
 
 # Cell
 def update_lf_analytic(mod, y = None, X = None, phi_mu = None, phi_sigma = None):
-
+    clear_forecast_cache(mod)
 
     # If data is missing then skip discounting and updating, posterior = prior
     if y is None or np.isnan(y):
@@ -85,6 +88,7 @@ def update_lf_analytic(mod, y = None, X = None, phi_mu = None, phi_sigma = None)
 
 # Cell
 def update_lf_analytic_dlm(mod, y=None, X=None, phi_mu = None, phi_sigma = None):
+    clear_forecast_cache(mod)
 
     # If data is missing then skip discounting and updating, posterior = prior
     if y is None or np.isnan(y):
@@ -223,19 +227,18 @@ def forecast_path_lf_copula(mod, k, X = None, phi_mu = None, phi_sigma = None, p
         lambda_mu[i] = ft
         lambda_cov[i,i] = qt
 
-        # Find covariances with previous lambda values
-        for j in range(i):
-            # Covariance matrix between the state vector at times j, k
-            cov_ij = np.linalg.matrix_power(mod.G, i-j) @ Rlist[j]
-
-            # Covariance between lambda at times j, i
-            # If phi_psi is none, we assume the latent factors phi at times t+i, t+j are independent of one another
-            if phi_psi is None:
-                lambda_cov[j,i] = lambda_cov[i,j] = Flist[j].T @ cov_ij @ Flist[i]
-            else:
-                lambda_cov[j,i] = lambda_cov[i,j] = Flist[j].T @ cov_ij @ Flist[i] + \
+    # Find covariances between the lambda values at different horizons
+    # If phi_psi is none, we assume the latent factors phi at times t+i, t+j are independent of one another
+    if phi_psi is None:
+        lambda_cov += forecast_path_cov(mod, Flist, Rlist)
+    else:
+        cov, cov_lf = forecast_path_cov(mod, Flist, Rlist, idx=mod.ilf)
+        lambda_cov += cov
+        for i in range(k):
+            for j in range(i):
+                lambda_cov[j,i] = lambda_cov[i,j] = lambda_cov[i,j] + \
                                                     alist[i][mod.ilf].T @ phi_psi[i-1][:,:,j] @ alist[j][mod.ilf] + \
-                                                    np.trace(cov_ij[np.ix_(mod.ilf, mod.ilf)] @ phi_psi[i-1][:,:,j])
+                                                    np.trace(cov_lf[i,j] @ phi_psi[i-1][:,:,j])
 
     if return_mu_cov:
         return lambda_mu, lambda_cov
@@ -245,21 +248,58 @@ def forecast_path_lf_copula(mod, k, X = None, phi_mu = None, phi_sigma = None, p
     else:
         return forecast_path_copula_sim(mod, k, lambda_mu, lambda_cov, nsamps, t_dist, nu)
 
+# Internal Cell
+lf_pools = {}
+
+
+def get_lf_pool(processes=None):
+    """
+    Process pool for the sample-based latent factor updates. It is started on first use and reused by later updates,
+    rather than starting new worker processes at every time step. Pools are kept per process id, so a forked child
+    process starts its own pool.
+    """
+    key = (os.getpid(), processes)
+    if key not in lf_pools:
+        lf_pools[key] = multiprocessing.Pool(processes)
+    return lf_pools[key]
+
+# Cell
+def shutdown_lf_pools():
+    """
+    Close the process pools started for the sample-based latent factor updates, and wait for their workers to exit.
+    This also runs when the interpreter exits. A later parallel update starts a new pool.
+    """
+    for key in list(lf_pools):
+        pool = lf_pools.pop(key)
+        # A pool inherited from the parent of a forked process belongs to the parent, so it is only dropped here
+        if key[0] == os.getpid():
+            pool.close()
+            pool.join()
+
+
+atexit.register(shutdown_lf_pools)
+
 # Cell
 def update_lf_sample(mod, y = None, X = None, phi_samps = None, parallel=False):
     """
     DGLM update function with samples of a latent factor.
 
     $\phi_{samps}$ = Array of simulated values of a latent factor.
-    """
 
+    parallel: If True, the samples are split across a persistent process pool (see `get_lf_pool`), which is closed by
+    `shutdown_lf_pools`. Any other pool or executor with a `map` method, such as a `multiprocessing.Pool`, can also be
+    passed in and is used instead. The samples are split into one batch per worker of the pool.
 
+    The effective sample size of the sample weights is stored in `mod.lf_ess`.
+    """
+    clear_forecast_cache(mod)
 
     # If data is missing then skip discounting and updating, posterior = prior
     if y is None or np.isnan(y):
         mod.t += 1
         mod.m = mod.a
         mod.C = mod.R
+        mod.lf_ess = np.nan if phi_samps is None else len(phi_samps)
 
         # Get priors a, R for time t + 1 from the posteriors m, C
         mod.a = mod.G @ mod.m
@@ -274,18 +314,23 @@ def update_lf_sample(mod, y = None, X = None, phi_samps = None, parallel=False):
 
         # Update m, C using a weighted average of the samples
         if parallel:
-            f = partial(update_lf_sample_forwardfilt, mod, y, mod.F, mod.a, mod.R)
-            p = multiprocessing.Pool(10)
-            output = p.map(f, phi_samps)
-            p.close()
+            # Split the samples into one batch per worker, so the model is only sent once to each worker
+            pool = get_lf_pool() if parallel is True else parallel
+            nworkers = getattr(pool, '_processes', None) or getattr(pool, '_max_workers', None) or os.cpu_count()
+            f = partial(update_lf_sample_batch, mod, y, mod.F, mod.a, mod.R)
+            output = list(pool.map(f, np.array_split(np.asarray(phi_samps), min(len(phi_samps), nworkers))))
+            mlist, RFlist, clist, logliklist = [np.concatenate(x) for x in zip(*output)]
         else:
-            output = map(lambda p: update_lf_sample_forwardfilt(mod, y, mod.F, mod.a, mod.R, p), phi_samps)
-        mlist, Clist, logliklist = list(map(list, zip(*output)))
-        w = (np.exp(logliklist) / np.sum(np.exp(logliklist))).reshape(-1,1,1)
-        mlist = np.array(mlist)
-        Clist = np.array(Clist)
-        mod.m = np.sum(mlist*w, axis=0)
-        mod.C = np.sum(Clist*w, axis=0) + np.cov((mlist).reshape(-1, mod.m.shape[0]), rowvar=False, aweights = w.reshape(-1))
+            mlist, RFlist, clist, logliklist = update_lf_sample_batch(mod, y, mod.F, mod.a, mod.R, phi_samps)
+        # Normalize the weights on the log scale, so that very small likelihoods don't underflow to 0/0
+        w = np.exp(logliklist - logsumexp(logliklist))
+        mod.lf_ess = 1 / np.sum(w**2)
+
+        # Mixture moments: C is the weighted average of the sample posterior variances R + c * RF @ RF.T,
+        # plus the variance of the sample posterior means
+        mod.m = (w @ mlist).reshape(-1, 1)
+        dm = mlist - mod.m.reshape(1, -1)
+        mod.C = mod.R + (RFlist * (w * clist)[:, None]).T @ RFlist + (dm * w[:, None]).T @ dm
 
         # Add 1 to the time index
         mod.t += 1
@@ -299,6 +344,36 @@ def update_lf_sample(mod, y = None, X = None, phi_samps = None, parallel=False):
         mod.W = mod.get_W(X=X)
         mod.R = mod.R + mod.W
 
+# Cell
+def update_lf_sample_batch(mod, y, F, a, R, phi_samps):
+    """
+    Forward filter update for a batch of latent factor samples, with one row of the regression vector per sample.
+
+    :return: The posterior means m and the log-likelihood of 'y' for each sample. The posterior variances are
+    returned as R @ F and c for each sample, with C = R + c * (R @ F) @ (R @ F).T, to avoid forming the p x p matrices.
+    """
+    # Regression vectors for all of the samples, shape (nsamps, p)
+    phi_samps = np.asarray(phi_samps, dtype=float)
+    Fs = np.repeat(F.reshape(1, -1), len(phi_samps), axis=0)
+    if mod.nlf > 0:
+        Fs[:, mod.ilf] = phi_samps.reshape(len(phi_samps), mod.nlf)
+
+    # Mean and variance of the linear predictor for all of the samples
+    RF = Fs @ R.T
+    ft = Fs @ a.reshape(-1)
+    qt = mod.get_qt(np.einsum('ij,ij->i', Fs, RF))
+    # get the conjugate prior parameters
+    param1, param2 = mod.get_conjugate_params(ft, qt, mod.param1, mod.param2)
+    # Get the log-likelihood of 'y' under these parameters
+    loglik = mod.loglik(y, param1, param2)
+    # Update to the conjugate posterior after observing 'y'
+    param1, param2, ft_star, qt_star = mod.update_conjugate_params(y, param1, param2)
+    # Kalman filter update on the state vector (using Linear Bayes approximation)
+    m = a.reshape(1, -1) + RF * ((ft_star - ft) / qt)[:, None]
+    c = -(1 - qt_star / qt) / qt
+
+    return m, RF, c, loglik
+
 # Cell
 def update_lf_sample_forwardfilt(mod, y, F, a, R, phi):
     F = update_F_lf(mod, phi, F=F)
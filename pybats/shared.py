@@ -7,37 +7,68 @@ __all__ = ['load_standard_holidays', 'cov2corr', 'load_sales_example', 'load_sal
 # Internal Cell
 #exporti
 import numpy as np
-import pandas as pd
 import scipy as sc
+import math
 import pickle
 from scipy.special import digamma
-from pandas.tseries.holiday import AbstractHolidayCalendar, USMartinLutherKingJr, USMemorialDay, Holiday, USLaborDay, \
-    USThanksgivingDay
 import os
-import pickle
-import zlib
+from functools import partial, lru_cache
 
 # Internal Cell
 
+@lru_cache(maxsize=None)
 def load_interpolators():
+    """
+    Load the conjugate parameter interpolators. They are read from disk the first time they are needed, and then
+    cached for the life of the process. If the tables cannot be read, an error is raised and nothing is cached. The
+    tables are built by scripts/update_interpols.py, which also records the largest error of the interpolated log
+    parameters between the knots in max_error.
+    """
 
     pkg_data_dir = os.path.dirname(os.path.abspath(__file__)) + '/pkg_data'
     #pkg_data_dir = os.getcwd().split('pybats')[0] + 'pybats/pybats/pkg_data'
     #pkg_data_dir = globals()['_dh'][0] + '/pkg_data'
 
     try:
-        with open(pkg_data_dir + '/interp_beta.pickle.gzip', 'rb') as fl:
-            interp_beta = pickle.loads(zlib.decompress(fl.read()))
+        with np.load(pkg_data_dir + '/interp_beta.npz') as tables:
+            interp_beta = partial(table_transformer, ft_knots=tables['ft_knots'], sd_knots=tables['sd_knots'],
+                                  log_alpha=tables['log_alpha'], log_beta=tables['log_beta'])
+            interp_beta.ft_lb, interp_beta.ft_ub, interp_beta.qt_lb, interp_beta.qt_ub = tables['bounds']
+            interp_beta.max_error = tables['max_error']
 
-        with open(pkg_data_dir + '/interp_gamma.pickle.gzip', 'rb') as fl:
-            interp_gamma = pickle.loads(zlib.decompress(fl.read()))
+        with np.load(pkg_data_dir + '/interp_gamma.npz') as tables:
+            interp_gamma = partial(gamma_table_transformer, sd_knots=tables['sd_knots'],
+                                   log_alpha=tables['log_alpha'])
+            interp_gamma.ft_lb, interp_gamma.ft_ub, interp_gamma.qt_lb, interp_gamma.qt_ub = tables['bounds']
+            interp_gamma.max_error = tables['max_error']
 
-    except:
-        print('WARNING: Unable to load interpolator. Code will run slower.')
-        interp_beta, interp_gamma = None, None
+    except (OSError, KeyError, ValueError) as e:
+        raise ValueError('Error: Unable to load the conjugate interpolators from ' + pkg_data_dir) from e
 
     return interp_beta, interp_gamma
 
+# Internal Cell
+def interp_linear_2d(x, y, x_knots, y_knots, z):
+    # Bilinear interpolation of the table z, defined on the grid x_knots by y_knots, at the points (x, y)
+    i = np.clip(np.searchsorted(x_knots, x, side='right') - 1, 0, len(x_knots) - 2)
+    j = np.clip(np.searchsorted(y_knots, y, side='right') - 1, 0, len(y_knots) - 2)
+    wx = (x - x_knots[i]) / (x_knots[i + 1] - x_knots[i])
+    wy = (y - y_knots[j]) / (y_knots[j + 1] - y_knots[j])
+    return (1 - wx) * ((1 - wy) * z[i, j] + wy * z[i, j + 1]) + wx * ((1 - wy) * z[i + 1, j] + wy * z[i + 1, j + 1])
+
+# Internal Cell
+def table_transformer(ft, qt, ft_knots, sd_knots, log_alpha, log_beta):
+    # The tables hold log(alpha) and log(beta) at each knot of a grid over the mean and std dev
+    ft, sd = np.ravel(ft), np.sqrt(np.ravel(qt))
+    return np.exp(interp_linear_2d(ft, sd, ft_knots, sd_knots, log_alpha)), \
+           np.exp(interp_linear_2d(ft, sd, ft_knots, sd_knots, log_beta))
+
+# Internal Cell
+def gamma_table_transformer(ft, qt, sd_knots, log_alpha):
+    alpha = np.exp(np.interp(np.sqrt(np.ravel(qt)), sd_knots, log_alpha))
+    beta = np.exp(digamma(alpha) - ft)
+    return alpha, beta
+
 # Internal Cell
 # I need this helper in a module file for pickle reasons ...
 def transformer(ft, qt, fn1, fn2):
@@ -51,8 +82,65 @@ def gamma_transformer(ft, qt, fn):
     return alpha, beta
 
 # Internal Cell
+# Coefficients of the asymptotic series for digamma and trigamma in powers of 1/z^2, from the Bernoulli numbers. With
+# z >= 10 the series are accurate to double precision.
+asymptotic_coefs = np.array([[1 / 12, -1 / 120, 1 / 252, -1 / 240, 1 / 132, -691 / 32760, 1 / 12],
+                             [1 / 6, -1 / 30, 1 / 42, -1 / 30, 5 / 66, -691 / 2730, 7 / 6]]).T
+
+
+def digamma_trigamma_scalar(z):
+    # Shift z up to at least 10, then use the asymptotic series
+    if not z > 0:
+        return float(sc.special.digamma(z)), float(sc.special.polygamma(1, z))
+    d, t = 0., 0.
+    while z < 10:
+        d -= 1 / z
+        t += 1 / (z * z)
+        z += 1
+    r = 1 / z
+    r2 = r * r
+    s0, s1, p = 0., 0., 1.
+    for c0, c1 in asymptotic_coefs.tolist():
+        p *= r2
+        s0 += c0 * p
+        s1 += c1 * p
+    return d + math.log(z) - r / 2 - s0, t + r + r2 / 2 + r * s1
+
+
+def digamma_trigamma(x):
+    """
+    :param x: Positive values
+    :return: digamma(x) and trigamma(x), computed together. x is shifted up with the recurrences
+    digamma(x) = digamma(x + 1) - 1/x and trigamma(x) = trigamma(x + 1) + 1/x^2, and then the asymptotic series are used.
+    """
+    x = np.asarray(x, dtype=float)
+
+    # A few values are done one at a time, which skips the array overhead in the updates of a single model
+    if x.size <= 4:
+        d, t = np.array([digamma_trigamma_scalar(z) for z in x.reshape(-1).tolist()]).reshape(-1, 2).T
+        return (d[0], t[0]) if x.ndim == 0 else (d.reshape(x.shape), t.reshape(x.shape))
+
+    z = x.reshape(-1)
+    other = ~(z > 0)
+    if other.any():
+        z = np.where(other, 1., z)
+
+    # Every value is shifted by 10, so that the recurrence terms can be summed as a block
+    r = 1 / (z[:, None] + np.arange(10))
+    z = z + 10
+    s = np.cumprod(np.repeat(z[:, None] ** -2, asymptotic_coefs.shape[0], axis=1), axis=1) @ asymptotic_coefs
+    d = np.log(z) - 0.5 / z - s[:, 0] - r.sum(axis=1)
+    t = (1 + 0.5 / z + s[:, 1]) / z + np.einsum('ij,ij->i', r, r)
+
+    # Anything that isn't positive falls back to scipy
+    if other.any():
+        xo = x.reshape(-1)[other]
+        d[other], t[other] = sc.special.digamma(xo), sc.special.polygamma(1, xo)
+    return d.reshape(x.shape), t.reshape(x.shape)
+
+
 def trigamma(x):
-    return sc.special.polygamma(x=x, n=1)
+    return digamma_trigamma(x)[1]
 
 # Internal Cell
 def save(obj, filename):
@@ -77,6 +165,8 @@ def define_holiday_regressors(X, dates, holidays=None):
     """
     if holidays is not None:
         if len(holidays) > 0:
+            from pandas.tseries.holiday import AbstractHolidayCalendar
+
             if X is None:
                 n = len(dates)
             else:
@@ -103,6 +193,7 @@ def load_standard_holidays():
     """
     Load in a list of standard holidays
     """
+    from pandas.tseries.holiday import USMartinLutherKingJr, USMemorialDay, Holiday, USLaborDay, USThanksgivingDay
 
     holidays = [USMartinLutherKingJr,
                 USMemorialDay,
@@ -129,6 +220,7 @@ def load_sales_example():
     """
     Read data for the first sales forecasting example
     """
+    import pandas as pd
     data_dir = os.path.dirname(os.path.abspath(__file__)) + '/pkg_data/'
     return pd.read_csv(data_dir + 'sales.csv', index_col=0)[['Sales', 'Advertising']]
 
@@ -137,6 +229,7 @@ def load_sales_example2():
     """
     Read data for the second sales forecasting example
     """
+    import pandas as pd
     data_dir = os.path.dirname(os.path.abspath(__file__)) + '/pkg_data/'
     data = pd.read_pickle(data_dir + 'sim_sales_data')
     data = data.set_index('Date')
@@ -165,6 +258,7 @@ def load_dlmm_example():
     """
     Read data for the DBCM latent factor example
     """
+    import pandas as pd
     data_dir = os.path.dirname(os.path.abspath(__file__)) + '/pkg_data/'
     data = pd.read_csv(data_dir + 'dlmm_example_data.csv')
     data.DATE = pd.to_datetime(data.DATE)
@@ -176,6 +270,7 @@ def load_us_inflation():
     """
     Read in quarterly US inflation data
     """
+    import pandas as pd
     data_dir = os.path.dirname(os.path.abspath(__file__)) + '/pkg_data/'
     data = pd.read_csv(data_dir + 'us_inflation.csv')
     return data
@@ -185,6 +280,7 @@ def load_us_inflation_forecasts():
     """
     Read in quarterly US inflation data along with forecasts from 4 models
     """
+    import pandas as pd
     data_dir = os.path.dirname(os.path.abspath(__file__)) + '/pkg_data/'
 
     data = pd.read_csv(data_dir + 'bps_inflation.csv')
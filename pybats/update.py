@@ -16,21 +16,115 @@ def update_F(mod, X, F=None):
             F[mod.iregn] = X.reshape(mod.nregn, 1)
         return F
 
+# Internal Cell
+def clear_forecast_cache(mod):
+    # The forecasts cached on the model are for the state before the update
+    for name in ['forecast_aR_cache', 'forecast_conj_cache']:
+        mod.__dict__.pop(name, None)
+
+# Internal Cell
+def G_block_plan(G_blocks):
+    """
+    :param G_blocks: The diagonal blocks of the evolution matrix G
+    :return: Plan for multiplying by G. Identity blocks are skipped, the 2x2 blocks (seasonal harmonics and a locally
+    linear trend) are applied together as vectors, and any other block is applied as a dense matrix. Returns None for
+    small states, where the dense matrix products are faster.
+    """
+    if sum(Gb.shape[0] for Gb in G_blocks) < 50:
+        return None
+
+    i0, g, dense = [], [], []
+    i = 0
+    for Gb in G_blocks:
+        n = Gb.shape[0]
+        if np.array_equal(Gb, np.identity(n)):
+            pass
+        elif n == 2:
+            i0.append(i)
+            g.append(Gb.reshape(-1))
+        else:
+            dense.append((slice(i, i + n), Gb))
+        i += n
+    i0 = np.array(i0, dtype=int)
+    return i0, i0 + 1, np.array(g, dtype=float).reshape(-1, 4).T, dense
+
+
+def apply_G(plan, M):
+    # Overwrite the rows of M with G @ M, using a plan from G_block_plan
+    i0, i1, (g00, g01, g10, g11), dense = plan
+    if len(i0) > 0:
+        M0, M1 = M[i0], M[i1]
+        M[i0] = g00[:, None] * M0 + g01[:, None] * M1
+        M[i1] = g10[:, None] * M0 + g11[:, None] * M1
+    for idx, Gb in dense:
+        M[idx] = Gb @ M[idx]
+
+# Internal Cell
+def work_buffers(mod):
+    """
+    :param mod: model
+    :return: Two p x p work arrays for the temporary products in an update. They are allocated once and cached on the
+    model. The variances mod.C, mod.R and mod.W are new arrays at every update, so earlier references keep their values.
+    """
+    p = mod.R.shape[0]
+    bufs = getattr(mod, 'update_buffers', None)
+    if bufs is None or bufs[0].shape != (p, p):
+        bufs = mod.update_buffers = (np.empty([p, p]), np.empty([p, p]))
+    return bufs
+
+
+def posterior_cov(mod, RF=None, c=0.):
+    """
+    Posterior variance C = R + c * RF @ RF.T. The scaled outer product is formed in a work buffer, and the sum with R is
+    written to a new array, which becomes mod.C. With RF=None the posterior variance is a copy of R, for a missing
+    observation.
+    """
+    if RF is None:
+        return mod.R.copy()
+    RFRF = np.multiply(RF, RF.T, out=work_buffers(mod)[0])
+    RFRF *= c
+    return RFRF + mod.R
+
+
+def evolve(mod, X=None, discount=True):
+    """
+    Get the priors a, R for time t + 1 from the posteriors m, C, and the evolution variance W. The products G C G' are
+    formed in the work buffers, and R and W are new arrays.
+    """
+    GC, GCG = work_buffers(mod)
+
+    # The block plan is only used while G is still the matrix that it was built from
+    plan = getattr(mod, 'G_plan', None)
+    if plan is not None and plan[0] is mod.G and plan[1] is not None:
+        mod.a = mod.m.copy()
+        apply_G(plan[1], mod.a)
+        np.copyto(GCG, mod.C)
+        apply_G(plan[1], GCG)
+        apply_G(plan[1], GCG.T)
+    else:
+        mod.a = mod.G @ mod.m
+        np.matmul(mod.G, mod.C, out=GC)
+        np.matmul(GC, mod.G.T, out=GCG)
+    mod.R = np.add(GCG, GCG.T)
+    mod.R /= 2
+
+    # Discount information in the time t + 1 prior
+    mod.W = mod.get_W(X=X)
+    if discount:
+        mod.R += mod.W
+
 # Cell
 def update(mod, y = None, X = None):
+    clear_forecast_cache(mod)
 
     # If data is missing then skip discounting and updating, posterior = prior
     if y is None or np.isnan(y):
         mod.t += 1
         mod.m = mod.a
-        mod.C = mod.R
+        mod.C = posterior_cov(mod)
 
         # Get priors a, R for time t + 1 from the posteriors m, C
-        mod.a = mod.G @ mod.m
-        mod.R = mod.G @ mod.C @ mod.G.T
-        mod.R = (mod.R + mod.R.T)/2
-
-        mod.W = mod.get_W(X=X)
+        evolve(mod, X, discount=False)
 
     else:
 
@@ -49,33 +143,25 @@ def update(mod, y = None, X = None):
         mod.param1, mod.param2, ft_star, qt_star = mod.update_conjugate_params(y, mod.param1, mod.param2)
 
         # Filter update on the state vector (using Linear Bayes approximation)
-        mod.m = mod.a + mod.R @ mod.F * (ft_star - ft)/qt
-        mod.C = mod.R - mod.R @ mod.F @ mod.F.T @ mod.R * (1 - qt_star/qt)/qt
-
-        # Get priors a, R for time t + 1 from the posteriors m, C
-        mod.a = mod.G @ mod.m
-        mod.R = mod.G @ mod.C @ mod.G.T
-        mod.R = (mod.R + mod.R.T)/2
+        RF = mod.R @ mod.F
+        mod.m = mod.a + RF * (ft_star - ft)/qt
+        mod.C = posterior_cov(mod, RF, -(1 - qt_star/qt)/qt)
 
-        # Discount information in the time t + 1 prior
-        mod.W = mod.get_W(X=X)
-        mod.R = mod.R + mod.W
+        # Get priors a, R for time t + 1 from the posteriors m, C, and discount information
+        evolve(mod, X)
 
 # Cell
 def update_dlm(mod, y = None, X = None):
+    clear_forecast_cache(mod)
 
     # If data is missing then skip discounting and updating, posterior = prior
     if y is None or np.isnan(y):
         mod.t += 1
         mod.m = mod.a
-        mod.C = mod.R
+        mod.C = posterior_cov(mod)
 
         # Get priors a, R for time t + 1 from the posteriors m, C
-        mod.a = mod.G @ mod.m
-        mod.R = mod.G @ mod.C @ mod.G.T
-        mod.R = (mod.R + mod.R.T)/2
-
-        mod.W = mod.get_W(X=X)
+        evolve(mod, X, discount=False)
 
     else:
         update_F(mod, X)
@@ -101,33 +187,25 @@ def update_dlm(mod, y = None, X = None):
         mod.n = mod.n + 1
         mod.s = mod.s * rt
         mod.m = mod.a + At * et
-        mod.C = rt * (mod.R - qt * At @ At.T)
-
-        # Get priors a, R for time t + 1 from the posteriors m, C
-        mod.a = mod.G @ mod.m
-        mod.R = mod.G @ mod.C @ mod.G.T
-        mod.R = (mod.R + mod.R.T)/2
+        mod.C = posterior_cov(mod, At, -qt)
+        mod.C *= rt
 
-        # Discount information
-        mod.W = mod.get_W(X=X)
-        mod.R = mod.R + mod.W
+        # Get priors a, R for time t + 1 from the posteriors m, C, and discount information
+        evolve(mod, X)
         mod.n = mod.delVar * mod.n
 
 # Cell
 def update_bindglm(mod, n=None, y=None, X=None):
+    clear_forecast_cache(mod)
 
     # If data is missing then skip discounting and updating, posterior = prior
     if y is None or np.isnan(y) or n is None or np.isnan(n) or n == 0:
         mod.t += 1
         mod.m = mod.a
-        mod.C = mod.R
+        mod.C = posterior_cov(mod)
 
         # Get priors a, R for time t + 1 from the posteriors m, C
-        mod.a = mod.G @ mod.m
-        mod.R = mod.G @ mod.C @ mod.G.T
-        mod.R = (mod.R + mod.R.T) / 2
-
-        mod.W = mod.get_W(X=X)
+        evolve(mod, X, discount=False)
 
     else:
 
@@ -146,14 +224,9 @@ def update_bindglm(mod, n=None, y=None, X=None):
         mod.param1, mod.param2, ft_star, qt_star = mod.update_conjugate_params(n, y, mod.param1, mod.param2)
 
         # Kalman filter update on the state vector (using Linear Bayes approximation)
-        mod.m = mod.a + mod.R @ mod.F * (ft_star - ft) / qt
-        mod.C = mod.R - mod.R @ mod.F @ mod.F.T @ mod.R * (1 - qt_star / qt) / qt
-
-        # Get priors a, R for time t + 1 from the posteriors m, C
-        mod.a = mod.G @ mod.m
-        mod.R = mod.G @ mod.C @ mod.G.T
-        mod.R = (mod.R + mod.R.T) / 2
+        RF = mod.R @ mod.F
+        mod.m = mod.a + RF * (ft_star - ft) / qt
+        mod.C = posterior_cov(mod, RF, -(1 - qt_star / qt) / qt)
 
-        # Discount information in the time t + 1 prior
-        mod.W = mod.get_W(X=X)
-        mod.R = mod.R + mod.W
\ No newline at end of file
+        # Get priors a, R for time t + 1 from the posteriors m, C, and discount information
+        evolve(mod, X)
@@ -1,102 +1,107 @@
 import numpy as np
 
 import sys
+import argparse
 
 sys.path.insert(0, '.')
 
-from pybats.conjugates import bern_conjugate_params, pois_conjugate_params, pois_alpha_param
-from pybats.shared import transformer, trigamma, gamma_transformer
-from scipy import interpolate
-from scipy import optimize as opt
+from pybats.conjugates import beta_newton, gamma_newton
+from pybats.shared import interp_linear_2d, trigamma
 from scipy.special import digamma
 
-import pickle
-import zlib
-from functools import partial
 
+def _sd_knots(sd_lb, sd_ub, num_sd):
+    # knots for the std dev on a log scale, so the relative spacing is the same across the range
+    return np.exp(np.linspace(np.log(sd_lb), np.log(sd_ub), num_sd))
 
-def _get_grid(ft_lb, ft_ub, qt_lb, qt_ub, num=300j):
-    # get a grid of means on a linear scale and std devs on log scale
-    ft, qt = np.mgrid[ft_lb:ft_ub:num, np.log(qt_lb):np.log(qt_ub):num]
-    return ft.flatten(), np.exp(qt.flatten())
 
-def interp_gamma():
-    """
-    We will interpolate based on reasonable values of the std dev and use the exact mean.
+def _within_cells(knots, fracs=(0.25, 0.5, 0.75)):
+    # points inside each cell between the knots, where the linear interpolation error is largest
+    return np.concatenate([knots[:-1] + f * np.diff(knots) for f in fracs])
 
-    For the std dev, 0.001 is a very small std dev and 4 is a pretty big spread (on the log scale).
 
-    :return: a stand in fn for interpolating the conjugate map
-    """
-    # get the grid we will search
-    qt_lb, qt_ub = 0.0001, 4
-    qt = np.exp(np.linspace(np.log(qt_lb), np.log(qt_ub), 5000))
+def _solve_gamma(qt):
+    alpha = gamma_newton(0., qt, max_iter=50)[0]
+    if not np.allclose(trigamma(alpha), qt, rtol=1e-10, atol=0):
+        raise ValueError('Error: The gamma solver did not converge on the grid')
+    return alpha
 
-    # do a bunch of solves
-    z = np.empty(len(qt))
-    for i in range(len(qt)):
-        z[i] = np.log(pois_alpha_param(qt[i] ** 2))
 
-    knots = np.exp(np.linspace(np.log(qt[5]), np.log(qt[-5]), 100))
-    bbox = [0, qt_ub + 2]
-    _interp_fn_log_alpha = interpolate.LSQUnivariateSpline(qt, z,
-                                                           knots, bbox=bbox, k=1)
+def _solve_beta(ft, qt):
+    alpha, beta = beta_newton(ft, qt, max_iter=100)
+    if not (np.allclose(digamma(alpha) - digamma(beta), ft, rtol=0, atol=1e-10) and
+            np.allclose(trigamma(alpha) + trigamma(beta), qt, rtol=1e-10, atol=0)):
+        raise ValueError('Error: The beta solver did not converge on the grid')
+    return alpha, beta
 
-    # transform to original scale and variance instead of std dev
-    fn = partial(gamma_transformer, fn=_interp_fn_log_alpha)
-    fn.ft_lb, fn.ft_ub, fn.qt_lb, fn.qt_ub = -np.inf, np.inf, bbox[0], bbox[1]
-    return fn
 
+def interp_gamma(sd_lb=0.001, sd_ub=10, num_sd=400):
+    """
+    The gamma table holds log(alpha) at knots of the std dev, and beta is found exactly from the mean.
 
-def interp_beta():
+    :param sd_lb: Smallest std dev in the table. Below this, qt is small enough to use an approximation
+    :param sd_ub: Largest std dev in the table
+    :param num_sd: Number of knots for the std dev, on a log scale
+    :return: The arrays for the table, and the largest error in log(alpha) between the knots
     """
-    We will interpolate based on reasonable values of the mean and std dev.
+    sd_knots = _sd_knots(sd_lb, sd_ub, num_sd)
+    log_alpha = np.log(_solve_gamma(sd_knots ** 2))
+
+    # error bound, from the exact solution inside each cell of the table
+    sd = _within_cells(sd_knots)
+    max_error = np.abs(np.interp(sd, sd_knots, log_alpha) - np.log(_solve_gamma(sd ** 2))).max()
 
-    For beta, -8 is pretty small on the log scale and 8 is quite large. Similarly,
-    0.001 is a very small std dev and 4 is a pretty big spread (on the log scale).
+    return {'sd_knots': sd_knots, 'log_alpha': log_alpha,
+            'bounds': np.array([-np.inf, np.inf, sd_lb, sd_ub]),
+            'max_error': np.array([max_error])}
 
-    :return: a stand in fn for interpolating the conjugate map
+
+def interp_beta(ft_lb=-12, ft_ub=12, num_ft=241, sd_lb=0.001, sd_ub=10, num_sd=200):
+    """
+    The beta table holds log(alpha) and log(beta) on a grid of knots for the mean and std dev.
+
+    :param ft_lb: Smallest mean in the table
+    :param ft_ub: Largest mean in the table
+    :param num_ft: Number of knots for the mean, on a linear scale
+    :param sd_lb: Smallest std dev in the table. Below this, qt is small enough to use an approximation
+    :param sd_ub: Largest std dev in the table
+    :param num_sd: Number of knots for the std dev, on a log scale
+    :return: The arrays for the table, and the largest errors in log(alpha) and log(beta) between the knots
     """
-    # get the grid we will search
-    ft_lb, ft_ub, qt_lb, qt_ub = -8, 8, 0.0001, 4
-    ft, qt = _get_grid(ft_lb, ft_ub, qt_lb, qt_ub)
-
-    # do a bunch of solves
-    z = np.empty((len(ft), 2))
-    for i in range(len(ft)):
-        z[i, :] = np.log(bern_conjugate_params(ft[i], qt[i] ** 2, alpha=1, beta=1, interp=False))
-
-    # ft and qt knots
-    num_knots = 75
-    ftv, qtv = np.sort(np.unique(ft)), np.sort(np.unique(qt))
-    # make sure there are a few points outside the knots
-    ft_knots = np.linspace(ftv[3], ftv[-3], num_knots)
-    qt_knots = np.exp(np.linspace(np.log(qtv[3]), np.log(qtv[-3]), num_knots))
-    bbox = [ft_lb - 2, ft_ub + 2, 0., qt_ub + 2]
-
-    _interp_fn_log_alpha = interpolate.LSQBivariateSpline(ft, qt, z[:, 0],
-                                                          ft_knots, qt_knots,
-                                                          bbox=bbox,
-                                                          kx=1, ky=1)
-    _interp_fn_log_beta = interpolate.LSQBivariateSpline(ft, qt, z[:, 1],
-                                                         ft_knots, qt_knots,
-                                                         bbox=bbox,
-                                                         kx=1, ky=1)
-    # transform to original scale and variance instead of std dev
-    fn = partial(transformer, fn1=_interp_fn_log_alpha, fn2=_interp_fn_log_beta)
-    fn.ft_lb, fn.ft_ub, fn.qt_lb, fn.qt_ub = bbox
-    return fn
+    ft_knots = np.linspace(ft_lb, ft_ub, num_ft)
+    sd_knots = _sd_knots(sd_lb, sd_ub, num_sd)
+    ft, sd = np.meshgrid(ft_knots, sd_knots, indexing='ij')
+    log_alpha, log_beta = np.log(_solve_beta(ft, sd ** 2))
+
+    # error bounds, from the exact solution inside each cell of the table
+    ft, sd = [v.ravel() for v in np.meshgrid(_within_cells(ft_knots), _within_cells(sd_knots), indexing='ij')]
+    alpha, beta = _solve_beta(ft, sd ** 2)
+    max_error = [np.abs(interp_linear_2d(ft, sd, ft_knots, sd_knots, log_alpha) - np.log(alpha)).max(),
+                 np.abs(interp_linear_2d(ft, sd, ft_knots, sd_knots, log_beta) - np.log(beta)).max()]
+
+    return {'ft_knots': ft_knots, 'sd_knots': sd_knots, 'log_alpha': log_alpha, 'log_beta': log_beta,
+            'bounds': np.array([ft_lb, ft_ub, sd_lb, sd_ub], dtype=float),
+            'max_error': np.array(max_error)}
 
 
 if __name__ == '__main__':
-    print('Calculating Gamma Interpolation FNs')
-    interp_gamma = interp_gamma()
-    print('Writing FNs to disk')
-    with open('interp_gamma.pickle.gzip', 'wb') as fl:
-        fl.write(zlib.compress(pickle.dumps(interp_gamma)))
-
-    print('Calculating Beta Interpolation FNs')
-    interp_beta = interp_beta()
-    print('Writing FNs to disk')
-    with open('interp_beta.pickle.gzip', 'wb') as fl:
-        fl.write(zlib.compress(pickle.dumps(interp_beta)))
+    parser = argparse.ArgumentParser(description='Build the interpolation tables for the conjugate parameters.')
+    parser.add_argument('--out', default='pybats/pkg_data', help='Directory to write the tables to')
+    parser.add_argument('--ft-range', type=float, nargs=2, default=[-12, 12], help='Range of the mean for beta')
+    parser.add_argument('--num-ft', type=int, default=241, help='Number of knots for the mean for beta')
+    parser.add_argument('--sd-range', type=float, nargs=2, default=[0.001, 10], help='Range of the std dev')
+    parser.add_argument('--num-sd-gamma', type=int, default=400, help='Number of knots for the std dev for gamma')
+    parser.add_argument('--num-sd-beta', type=int, default=200, help='Number of knots for the std dev for beta')
+    args = parser.parse_args()
+
+    print('Calculating Gamma Interpolation Table')
+    interp_gamma = interp_gamma(*args.sd_range, args.num_sd_gamma)
+    print('Max error in log(alpha): {:.2e}'.format(*interp_gamma['max_error']))
+    print('Writing table to disk')
+    np.savez(args.out + '/interp_gamma.npz', **interp_gamma)
+
+    print('Calculating Beta Interpolation Table')
+    interp_beta = interp_beta(*args.ft_range, args.num_ft, *args.sd_range, args.num_sd_beta)
+    print('Max error in log(alpha): {:.2e}, log(beta): {:.2e}'.format(*interp_beta['max_error']))
+    print('Writing table to disk')
+    np.savez(args.out + '/interp_beta.npz', **interp_beta)